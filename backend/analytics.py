@@ -0,0 +1,138 @@
+import argparse
+import os
+import sys
+from processors.data_loader import DataLoader
+from processors.filter_processor import FilterProcessor
+from processors.spatial_processor import SpatialProcessor
+from processors.parallel_processor import ParallelProcessor
+from processors.table_cache import TableCache
+from processors.grid_mask import CLIP_MODES
+from kde_analysis import perform_kde_analysis
+from hotspot_analysis import perform_hotspot_analysis
+from emerging_hotspot import run_emerging_hotspot_analysis
+
+# In-process pipeline: the load, filter and exclusion stages return DataFrames
+# that feed the analyses directly, so ps_removed_dt.csv / filtered_data.csv are
+# only written when asked for (save_incidents / --save-intermediate).
+#
+#   df = load_incidents('2024-01-01 00:00:00', '2024-06-30 23:59:59')
+#   perform_kde_analysis(df=df)
+#   perform_hotspot_analysis(df=filter_incidents(df, severities=['HIGH']))
+
+ANALYSES = ['kde', 'hotspot', 'emerging']
+
+def load_incidents(start_date=None, end_date=None, exclusion_radius=250, workers=1, table_cache=None):
+    """Prepared incidents in the date range, minus those near police stations (ps_removed_dt.csv)"""
+    data_loader = DataLoader()
+    filter_processor = FilterProcessor()
+    spatial_processor = SpatialProcessor(exclusion_radius=exclusion_radius)
+    parallel_processor = ParallelProcessor(workers) if workers > 1 else None
+
+    crime_df, police_df, _ = data_loader.load_prepared_data(
+        table_cache or TableCache(), spatial_processor, parallel_processor
+    )
+    if start_date and end_date:
+        crime_df = filter_processor.apply_datetime_filter(crime_df, start_date, end_date, data_loader.time_index)
+    return spatial_processor.remove_near_police_stations(crime_df, police_df)
+
+def filter_incidents(df, main_types=None, subtypes=None, severities=None, part_of_day=None,
+                     city_location='all', bitmap_index=None):
+    """Incidents matching the categorical and city filters (filtered_data.csv)"""
+    return FilterProcessor().apply_filters(
+        df,
+        main_types=main_types,
+        subtypes=subtypes,
+        severities=severities,
+        part_of_day=part_of_day,
+        city_location=city_location,
+        bitmap_index=bitmap_index
+    )
+
+def save_incidents(df, output_file, table_cache=None):
+    """Write a stage's table to CSV and cache it for the file-based readers"""
+    df.to_csv(output_file, index=False, encoding='utf-8')
+    (table_cache or TableCache()).store(output_file, df)
+    print(f"Data saved to {output_file}")
+
+def run_pipeline(args):
+    """Load, filter and analyse in one process; returns True if every analysis succeeded"""
+    filter_processor = FilterProcessor()
+    table_cache = TableCache()
+    analyses = [name.strip() for name in args.analyses.split(',')]
+    unknown = [name for name in analyses if name not in ANALYSES]
+    if unknown:
+        raise ValueError(f"Unknown analyses: {', '.join(unknown)} (choose from {', '.join(ANALYSES)})")
+
+    base_df = load_incidents(args.start_date, args.end_date, args.exclusion_radius, args.workers, table_cache)
+    print(f"Loaded {len(base_df)} incidents")
+
+    # The hotspot analysis reads the filtered table, the others the date-filtered base
+    has_other_filters = filter_processor.has_filters(args)
+    filtered_df = filter_processor.apply_all_filters(base_df, args) if has_other_filters else base_df
+
+    if args.save_intermediate:
+        save_incidents(base_df, 'ps_removed_dt.csv', table_cache)
+        if has_other_filters:
+            save_incidents(filtered_df, 'filtered_data.csv', table_cache)
+        elif os.path.exists('filtered_data.csv'):
+            os.remove('filtered_data.csv')
+            print("Removed existing filtered_data.csv (date-only filtering)")
+
+    success = True
+    if 'kde' in analyses:
+        success = perform_kde_analysis(df=base_df, workers=args.workers, tile_levels=args.tile_levels,
+                                       clip=args.clip, clip_buffer=args.clip_buffer) and success
+    if 'hotspot' in analyses:
+        success = perform_hotspot_analysis(df=filtered_df, clip=args.clip, clip_buffer=args.clip_buffer,
+                                           permutations=args.permutations, seed=args.seed, workers=args.workers,
+                                           early_stop=not args.full_permutations) and success
+    if 'emerging' in analyses:
+        try:
+            run_emerging_hotspot_analysis(base_df, clip=args.clip, clip_buffer=args.clip_buffer,
+                                          permutations=args.permutations, seed=args.seed, workers=args.workers,
+                                          early_stop=not args.full_permutations)
+        except Exception as e:
+            print(f"Error during emerging hotspot analysis: {e}", file=sys.stderr)
+            success = False
+    return success
+
+def parse_arguments():
+    parser = argparse.ArgumentParser(description='Run the filtering and analysis pipeline in one process.')
+    parser.add_argument('--start-date', type=str, help='Start datetime (YYYY-MM-DD HH:MM:SS)')
+    parser.add_argument('--end-date', type=str, help='End datetime (YYYY-MM-DD HH:MM:SS)')
+    parser.add_argument('--main-types', type=str, help='Comma-separated main types')
+    parser.add_argument('--subtypes', type=str, help='Comma-separated subtypes')
+    parser.add_argument('--severities', type=str, help='Comma-separated severities')
+    parser.add_argument('--part-of-day', type=str, help='Comma-separated time periods')
+    parser.add_argument('--city-location', type=str, choices=['all', 'inside', 'outside'],
+                       default='all', help='City location filter')
+    parser.add_argument('--exclusion-radius', type=float, default=250,
+                       help='Drop incidents within this many meters of a police station (default: 250)')
+    parser.add_argument('--workers', type=int, default=1,
+                       help='Number of processes for preparing the input data, evaluating the KDE grid '
+                            'and running the hotspot permutations')
+    parser.add_argument('--analyses', type=str, default=','.join(ANALYSES),
+                       help=f"Comma-separated analyses to run (default: {','.join(ANALYSES)})")
+    parser.add_argument('--clip', type=str, choices=CLIP_MODES, default='none',
+                       help='Restrict the analysis grids to the city boundary, the buffered incident hull, or both')
+    parser.add_argument('--clip-buffer', type=float, default=1000,
+                       help='Buffer around the incident hull in meters for --clip hull/both (default: 1000)')
+    parser.add_argument('--tile-levels', type=int, default=0,
+                       help='Also write a KDE tile pyramid with this many levels for /api/kde/kde-tiles (default: 0)')
+    parser.add_argument('--permutations', type=int, default=0,
+                       help='Permutations for hotspot pseudo p-values; 0 uses analytic p-values (default: 0)')
+    parser.add_argument('--seed', type=int, help='Random seed for the permutations')
+    parser.add_argument('--full-permutations', action='store_true',
+                       help='Run every permutation for every cell instead of stopping early once a '
+                            'cell is clearly (not) significant')
+    parser.add_argument('--save-intermediate', action='store_true',
+                       help='Also write ps_removed_dt.csv and filtered_data.csv as process_csv.py does')
+    return parser.parse_args()
+
+if __name__ == "__main__":
+    try:
+        success = run_pipeline(parse_arguments())
+    except Exception as e:
+        print(f"Error: {str(e)}", file=sys.stderr)
+        sys.exit(1)
+    sys.exit(0 if success else 1)
@@ -1,16 +1,23 @@
 import pandas as pd
 import geopandas as gpd
 import numpy as np
-from shapely.geometry import Point
-from libpysal.weights import DistanceBand
-from esda.getisord import G_Local
-from pymannkendall import original_test
+import shapely
 import warnings
 import argparse
 import sys
 import json
 from datetime import datetime
 from tqdm import tqdm
+from processors.table_cache import TableCache
+from processors.time_index import TimeIndex
+from processors.grid_mask import GridMask, CLIP_MODES
+from processors.getis_ord import LocalG
+from processors.parallel_processor import ParallelProcessor
+from processors.lattice_weights import lattice_weights
+from processors.distance_sweep import distance_sweep, peak_distance, parse_distances, SWEEP_STATISTICS
+from processors.space_time_cube import SpaceTimeCube, time_bin_index, mann_kendall_trends
+from utils.grid_utils import interior_cells
+from utils.projection_utils import to_projected, UTM_43N
 
 # Suppress specific warnings for cleaner output
 warnings.filterwarnings("ignore", category=RuntimeWarning, module="scipy.sparse")
@@ -32,158 +39,309 @@ def valid_date(s):
             msg = f"Not a valid date: '{s}'. Expected format YYYY-MM-DD or YYYY-MM-DD HH:MM:SS"
             raise argparse.ArgumentTypeError(msg)
 
-def create_space_time_cube(gdf, time_interval='2W', cell_size=500):
-    """Create space-time cube with Mann-Kendall trends and larger grid cells"""
-    print(f"Creating space-time cube with {len(gdf)} incidents")
+def create_space_time_cube(x, y, dates, time_interval='2W', cell_size=500, grid_mask=None):
+    """Create space-time cube with Mann-Kendall trends and larger grid cells
+
+    x, y are the incidents' projected (UTM 43N) coordinates. Each incident
+    is placed straight from its coordinates and timestamp (see
+    SpaceTimeCube): incidents on a cell edge fall in no cell, as with a
+    'within' join on the cell squares. With a grid_mask only the cells
+    centred inside its area are created. Returns the cube, the grid (each
+    cell's lattice position and lower-left corner, one row per cube row)
+    and each cell's Mann-Kendall trend ('no trend' for empty cells).
+    """
+    print(f"Creating space-time cube with {len(x)} incidents")
     
     # Temporal binning
     date_range = pd.date_range(
-        start=gdf['date'].min(),
-        end=gdf['date'].max(),
+        start=dates.min(),
+        end=dates.max(),
         freq=time_interval
     )
     
     if len(date_range) < 2:
         raise ValueError(f"Insufficient time range for analysis. Need at least 2 time periods, got {len(date_range)}")
     
-    gdf['time_bin'] = pd.cut(gdf['date'], bins=date_range, include_lowest=True)
+    time_bin = time_bin_index(dates, date_range)
     
-    # Remove rows with NaT time_bin
-    gdf = gdf.dropna(subset=['time_bin'])
+    # Remove incidents outside the time bins
+    binned = time_bin >= 0
+    x, y, time_bin = np.asarray(x)[binned], np.asarray(y)[binned], time_bin[binned]
     
-    if len(gdf) == 0:
+    if len(x) == 0:
         raise ValueError("No data remaining after temporal binning")
     
     # Spatial grid
-    minx, miny, maxx, maxy = gdf.total_bounds
+    minx, miny, maxx, maxy = x.min(), y.min(), x.max(), y.max()
     print(f"Spatial bounds: {minx:.2f}, {miny:.2f}, {maxx:.2f}, {maxy:.2f}")
     
     x_coords = np.arange(minx, maxx, cell_size)
     y_coords = np.arange(miny, maxy, cell_size)
     
-    grid_cells = []
-    for x in x_coords:
-        for y in y_coords:
-            cell = Point(x + cell_size/2, y + cell_size/2).buffer(cell_size/2, cap_style=3)
-            grid_cells.append(cell)
+    cell_mask = grid_mask.inside(x_coords + cell_size/2, y_coords + cell_size/2) if grid_mask is not None else None
+    if cell_mask is not None:
+        print(f"Clipped grid: {grid_mask.describe(cell_mask)}")
+    else:
+        cell_mask = np.ones((len(x_coords), len(y_coords)), dtype=bool)
     
-    grid = gpd.GeoDataFrame(geometry=grid_cells, crs=gdf.crs)
-    grid['cell_id'] = grid.index
+    # Cells column by column, as (i, j) lattice positions, for the weights and the output squares
+    cell_i, cell_j = np.nonzero(cell_mask)
+    grid = pd.DataFrame({'cell_i': cell_i, 'cell_j': cell_j, 'x': x_coords[cell_i], 'y': y_coords[cell_j]})
+    cell_rows = np.full(cell_mask.shape, -1, dtype=np.int64)
+    cell_rows[cell_i, cell_j] = grid.index
     print(f"Created {len(grid)} grid cells")
     
-    # Spatiotemporal aggregation
-    joined = gpd.sjoin(gdf, grid, how='left', predicate='within')
+    # Spatiotemporal aggregation; the edges are those of the cell squares
+    x_edges = np.append((x_coords + cell_size/2) - cell_size/2, (x_coords[-1] + cell_size/2) + cell_size/2)
+    y_edges = np.append((y_coords + cell_size/2) - cell_size/2, (y_coords[-1] + cell_size/2) + cell_size/2)
+    incident_i, incident_j = interior_cells(x, x_edges), interior_cells(y, y_edges)
+    rows = np.full(len(x), -1, dtype=np.int64)
+    inside = (incident_i >= 0) & (incident_j >= 0)
+    rows[inside] = cell_rows[incident_i[inside], incident_j[inside]]
     
-    # Drop rows that don't fall within any grid cell
-    joined = joined.dropna(subset=['index_right'])
+    # Drop incidents that don't fall within any grid cell
+    counted = rows >= 0
     
-    if len(joined) == 0:
+    if not counted.any():
         raise ValueError("No crimes fall within the grid cells")
     
-    cube = joined.groupby(['index_right', 'time_bin'], observed=True).size().unstack(fill_value=0)
-    print(f"Space-time cube dimensions: {cube.shape}")
+    cube = SpaceTimeCube(rows[counted], time_bin[counted], len(grid), date_range)
+    print(f"Space-time cube dimensions: {cube.shape} ({cube.counts.nnz} populated cell-bins)")
     
-    # Mann-Kendall for each grid cell
-    mk_results = {}
-    for cell_id, row in cube.iterrows():
-        if row.sum() > 0:
-            try:
-                mk_results[cell_id] = original_test(row.values)
-            except Exception as e:
-                print(f"Mann-Kendall test failed for cell {cell_id}: {e}")
-                mk_results[cell_id] = None
+    # Mann-Kendall for each populated grid cell
+    mk_trend = np.full(len(grid), 'no trend', dtype=object)
+    populated = cube.populated()
+    mk_trend[populated] = mann_kendall_trends(cube.series(populated))
     
-    return cube, grid, mk_results
+    return cube, grid, mk_trend
 
-def detect_emerging_hotspots(cube, grid, mk_results, time_step=4, distance=500):
-    """Sliding window hotspot detection with classification"""
+def cell_squares(x, y, cell_size):
+    """Square polygons of the cells with lower-left corners (x, y), as Point(centre).buffer(cap_style=3) draws them"""
+    half = cell_size / 2
+    cx, cy = np.asarray(x) + half, np.asarray(y) + half
+    corners = [(cx + half, cy + half), (cx + half, cy - half), (cx - half, cy - half), (cx - half, cy + half)]
+    return shapely.polygons(np.stack([np.column_stack(corner) for corner in corners], axis=1))
+
+def detect_emerging_hotspots(cube, grid, mk_trend, time_step=4, distance=500, permutations=0, seed=None,
+                             cell_size=500, workers=1, early_stop=True):
+    """Sliding window hotspot detection with classification
+
+    The distance-band weights depend only on the grid, so they are built
+    once from the cells' lattice positions and reused for every window;
+    the window counts of all cells come from one sparse product (see
+    SpaceTimeCube.window_sums). Cell squares are only drawn for the
+    significant results. p-values are analytic (normal) unless
+    permutations > 0 (see LocalG), run on one pool of `workers`
+    processes kept open for all windows.
+    """
     print(f"Detecting hotspots with {time_step}-period sliding window")
     
     results = []
-    time_bins = cube.columns.tolist()
+    time_bins = cube.time_bins
     
     if len(time_bins) < time_step:
         raise ValueError(f"Not enough time periods for analysis. Need at least {time_step}, got {len(time_bins)}")
     
-    for t in tqdm(range(time_step, len(time_bins)), desc="Processing time bins"):
-        time_window = time_bins[t-time_step:t]
-        data = cube[time_window].sum(axis=1).reset_index(name='crime_count')
-        
-        # Merge with grid using the correct index column
-        merged = grid.reset_index().rename(columns={'index': 'grid_index'})
-        merged = merged.merge(data, left_on='grid_index', right_on='index_right', how='left')
-        merged['crime_count'] = merged['crime_count'].fillna(0)
+    w = lattice_weights(
+        grid['cell_i'].values, grid['cell_j'].values,
+        (int(grid['cell_i'].max()) + 1, int(grid['cell_j'].max()) + 1),
+        cell_size, distance, binary=True
+    )
+    
+    window_counts = cube.window_sums(time_step)
+    
+    # One pool serves the permutations of every window; its processes only start once used
+    with ParallelProcessor(workers) as parallel_processor:
+        for t in tqdm(range(time_step, len(time_bins)), desc="Processing time bins"):
+            crime_count = window_counts[:, t - time_step].toarray().ravel().astype(float)
         
-        if merged['crime_count'].sum() == 0:
-            continue
+            if crime_count.sum() == 0:
+                continue
         
-        centroids = merged.geometry.centroid
-        coords = list(zip(centroids.x, centroids.y))
+            try:
+                gi = LocalG(crime_count, w, transform='B', permutations=permutations, seed=seed,
+                            early_stop=early_stop, parallel_processor=parallel_processor)
+                p_values = gi.p_sim if permutations else gi.p_norm
+                gi_score = gi.Zs
+                p_value = np.nan_to_num(p_values, nan=1.0, posinf=1.0, neginf=1.0)
+            except Exception as e:
+                print(f"Spatial analysis failed for time period {t}: {str(e)}")
+                gi_score = np.zeros(len(crime_count))
+                p_value = np.ones(len(crime_count))
         
-        try:
-            w = DistanceBand(coords, threshold=distance, binary=True)
-            gi = G_Local(merged['crime_count'].values, w, transform='B')
-            merged['gi_score'] = gi.Zs
-            merged['p_value'] = np.nan_to_num(gi.p_sim, nan=1.0, posinf=1.0, neginf=1.0)
-        except Exception as e:
-            print(f"Spatial analysis failed for time period {t}: {str(e)}")
-            merged['gi_score'] = 0
-            merged['p_value'] = 1.0
+            # Hotspot classification
+            conditions = [
+                (p_value <= 0.01) & (gi_score > 2.58),
+                (p_value <= 0.05) & (gi_score > 1.96),
+                (p_value <= 0.1) & (gi_score > 1.65),
+                (p_value <= 0.01) & (gi_score < -2.58),
+                (p_value <= 0.05) & (gi_score < -1.96),
+                (p_value <= 0.1) & (gi_score < -1.65)
+            ]
+            choices = [
+                'Hot Spot (99% Conf)', 'Hot Spot (95% Conf)', 'Hot Spot (90% Conf)',
+                'Cold Spot (99% Conf)', 'Cold Spot (95% Conf)', 'Cold Spot (90% Conf)'
+            ]
+            hotspot_type = np.select(conditions, choices, default='Not Significant')
         
-        merged['time_bin'] = str(time_bins[t])
+            # Emerging hotspot classification
+            hot = np.char.startswith(hotspot_type, 'Hot')
+            cold = np.char.startswith(hotspot_type, 'Cold')
+            emerging_type = np.full(len(crime_count), 'Neutral', dtype=object)
+            emerging_type[hot & (mk_trend == 'increasing')] = 'Intensifying'
+            emerging_type[hot & (mk_trend == 'decreasing')] = 'Diminishing'
+            emerging_type[cold & (mk_trend == 'decreasing')] = 'Cooling'
         
-        def get_trend(x):
-            if x and hasattr(x, 'trend'):
-                return x.trend
-            return 'no trend'
+            # Only keep significant results
+            significant = np.flatnonzero(hotspot_type != 'Not Significant')
+            if len(significant) > 0:
+                results.append(pd.DataFrame({
+                    'grid_index': significant,
+                    'crime_count': crime_count[significant],
+                    'gi_score': gi_score[significant],
+                    'p_value': p_value[significant],
+                    'time_bin': str(time_bins[t]),
+                    'mk_trend': mk_trend[significant],
+                    'hotspot_type': hotspot_type[significant],
+                    'emerging_type': emerging_type[significant]
+                }))
+    
+    if results:
+        hotspots = pd.concat(results, ignore_index=True)
+        cells = grid.loc[hotspots['grid_index']]
+        return gpd.GeoDataFrame(hotspots, geometry=cell_squares(cells['x'], cells['y'], cell_size), crs=UTM_43N)
+    else:
+        return None
+
+def run_emerging_hotspot_analysis(df, start_date=None, end_date=None, time_interval='2W', time_step=4,
+                                  distance=None, cell_size=500, output_file='emerging_hotspots.geojson',
+                                  clip='none', clip_buffer=1000, permutations=0, seed=None, workers=1,
+                                  early_stop=True, sweep_distances=None, sweep_statistic='moran'):
+    """Run the emerging hotspot analysis on an incident table and save the GeoJSON
+
+    clip limits the grid to the city boundary and/or the incidents' hull
+    grown by clip_buffer meters (see GridMask); empty cells outside it then
+    no longer count towards each window's Gi statistics. p-values are
+    analytic unless permutations > 0, in which case they are computed on
+    `workers` processes, stopping early per cell unless early_stop is False.
+    Neighbours are the cells within `distance` meters (default 500). With
+    sweep_distances, global Moran's I or General G of the cells' total
+    counts is first computed for each of those bands (see distance_sweep)
+    and, unless a distance is given, the peak band is used.
+    Returns the hotspots GeoDataFrame, or None when nothing significant was found.
+    """
+    # Handle different possible date column names
+    # (assign returns a new frame, so an in-memory table passed by the caller is left as is)
+    if 'signal_lan' in df.columns:
+        df = df.assign(date=pd.to_datetime(df['signal_lan'], errors='coerce'))
+    elif 'date' in df.columns:
+        df = df.assign(date=pd.to_datetime(df['date'], errors='coerce'))
+    else:
+        raise ValueError("No date column found. Expected 'signal_lan' or 'date'")
+    
+    # Drop rows with invalid dates
+    df = df.dropna(subset=['date'])
+    
+    print(f"Loaded {len(df)} crime incidents")
+    
+    # Apply date filtering if provided
+    if start_date or end_date:
+        start = start_date or df['date'].min()
+        end = end_date or df['date'].max()
         
-        merged['mk_trend'] = merged['grid_index'].map(
-            lambda x: get_trend(mk_results.get(x))
+        print(f"Filtering data from {start} to {end}")
+        df = TimeIndex.from_frame(df, 'date').select(df, start, end)
+        print(f"Filtered to {len(df)} incidents for date range")
+    
+    if len(df) == 0:
+        raise ValueError("No data available for the specified date range")
+    
+    print("Creating spatial data...")
+    # Remove rows with invalid coordinates
+    df = df.dropna(subset=['longitude', 'latitude'])
+    df = df[(df['longitude'] != 0) & (df['latitude'] != 0)]
+    
+    if len(df) == 0:
+        raise ValueError("No valid coordinates found in the data")
+    
+    x, y = to_projected(df['longitude'], df['latitude'])  # UTM Zone 43N for India
+    
+    print("Creating space-time cube...")
+    cube, grid, mk_trend = create_space_time_cube(
+        x, y, df['date'].values,
+        time_interval=time_interval, 
+        cell_size=cell_size,
+        grid_mask=GridMask.from_clip(clip, x, y, clip_buffer)
+    )
+    
+    if sweep_distances:
+        totals = np.asarray(cube.counts.sum(axis=1)).ravel()
+        sweep = distance_sweep(
+            grid['cell_i'].values, grid['cell_j'].values,
+            (int(grid['cell_i'].max()) + 1, int(grid['cell_j'].max()) + 1),
+            cell_size, totals, sweep_distances, sweep_statistic
         )
+        print(f"Distance sweep ({sweep_statistic}):")
+        print(sweep.to_string(index=False))
+        peak = peak_distance(sweep)
+        print(f"Peak distance band: {peak} m" if peak is not None else "No peak distance band found")
+        distance = distance or peak
+    distance = distance or 500
+    print(f"Distance band: {distance} m")
+    
+    print("Detecting emerging hotspots...")
+    hotspots = detect_emerging_hotspots(
+        cube, 
+        grid,
+        mk_trend,
+        time_step=time_step,
+        distance=distance,
+        permutations=permutations,
+        seed=seed,
+        cell_size=cell_size,
+        workers=workers,
+        early_stop=early_stop
+    )
+    
+    if hotspots is not None and len(hotspots) > 0:
+        # Filter and prepare output
+        hotspots = hotspots[hotspots['crime_count'] > 0]
+        hotspots = hotspots.to_crs("EPSG:4326")
         
-        # Hotspot classification
-        conditions = [
-            (merged['p_value'] <= 0.01) & (merged['gi_score'] > 2.58),
-            (merged['p_value'] <= 0.05) & (merged['gi_score'] > 1.96),
-            (merged['p_value'] <= 0.1) & (merged['gi_score'] > 1.65),
-            (merged['p_value'] <= 0.01) & (merged['gi_score'] < -2.58),
-            (merged['p_value'] <= 0.05) & (merged['gi_score'] < -1.96),
-            (merged['p_value'] <= 0.1) & (merged['gi_score'] < -1.65)
-        ]
-        choices = [
-            'Hot Spot (99% Conf)', 'Hot Spot (95% Conf)', 'Hot Spot (90% Conf)',
-            'Cold Spot (99% Conf)', 'Cold Spot (95% Conf)', 'Cold Spot (90% Conf)'
+        # Add centroid coordinates for point visualization
+        centroids = hotspots.geometry.centroid
+        hotspots['latitude'] = centroids.y
+        hotspots['longitude'] = centroids.x
+        
+        keep_columns = [
+            'geometry', 'time_bin', 'crime_count',
+            'gi_score', 'p_value', 'hotspot_type', 'emerging_type',
+            'latitude', 'longitude'
         ]
-        merged['hotspot_type'] = np.select(conditions, choices, default='Not Significant')
         
-        # Emerging hotspot classification
-        merged['emerging_type'] = 'Neutral'
-        merged.loc[
-            (merged['hotspot_type'].str.contains('Hot')) & 
-            (merged['mk_trend'] == 'increasing'),
-            'emerging_type'
-        ] = 'Intensifying'
-        merged.loc[
-            (merged['hotspot_type'].str.contains('Hot')) & 
-            (merged['mk_trend'] == 'decreasing'),
-            'emerging_type'
-        ] = 'Diminishing'
-        merged.loc[
-            (merged['hotspot_type'].str.contains('Cold')) & 
-            (merged['mk_trend'] == 'decreasing'),
-            'emerging_type'
-        ] = 'Cooling'
+        # Only keep columns that exist
+        available_columns = [col for col in keep_columns if col in hotspots.columns]
+        hotspots = hotspots[available_columns]
         
-        # Only keep significant results
-        significant = merged[merged['hotspot_type'] != 'Not Significant'].copy()
-        if len(significant) > 0:
-            results.append(significant)
-    
-    if results:
-        hotspots = gpd.GeoDataFrame(pd.concat(results, ignore_index=True), crs=grid.crs)
-        hotspots['time_bin'] = hotspots['time_bin'].astype(str)
+        print("Saving GeoJSON...")
+        hotspots.to_file(output_file, driver='GeoJSON')
+        
+        print(f"Analysis complete. Results saved to {output_file}")
+        print(f"Output contains {len(hotspots)} features")
+        print(f"Hot spots: {len(hotspots[hotspots['hotspot_type'].str.contains('Hot', na=False)])}")
+        print(f"Cold spots: {len(hotspots[hotspots['hotspot_type'].str.contains('Cold', na=False)])}")
+        print(f"Intensifying patterns: {len(hotspots[hotspots['emerging_type'] == 'Intensifying'])}")
         return hotspots
     else:
+        print("No significant hotspots detected in the analysis period")
+        # Create empty GeoJSON
+        empty_geojson = {
+            "type": "FeatureCollection",
+            "features": []
+        }
+        with open(output_file, 'w') as f:
+            json.dump(empty_geojson, f)
+        print("Created empty results file")
         return None
 
 def main():
@@ -200,10 +358,27 @@ def main():
                         help='Time interval for binning (e.g., 1W, 2W, 1M)')
     parser.add_argument('--time_step', type=int, default=4,
                         help='Temporal window size in time bins')
-    parser.add_argument('--distance', type=int, default=500,
-                        help='Spatial neighborhood distance in meters')
+    parser.add_argument('--distance', type=float,
+                        help='Spatial neighborhood distance in meters (default: 500, or the peak of --sweep_distances)')
+    parser.add_argument('--sweep_distances', type=str,
+                        help='Comma-separated distance bands in meters to sweep global autocorrelation over '
+                             'before the run, e.g. 500,750,1000,1500')
+    parser.add_argument('--sweep_statistic', choices=SWEEP_STATISTICS, default='moran',
+                        help="Global statistic for --sweep_distances: Moran's I or General G")
     parser.add_argument('--cell_size', type=int, default=500,
                         help='Grid cell size in meters')
+    parser.add_argument('--clip', choices=CLIP_MODES, default='none',
+                        help='Only build grid cells inside the city boundary, the buffered incident hull, or both')
+    parser.add_argument('--clip_buffer', type=float, default=1000,
+                        help='Buffer around the incident hull in meters for --clip hull/both')
+    parser.add_argument('--permutations', type=int, default=0,
+                        help='Permutations for pseudo p-values; 0 uses analytic normal p-values')
+    parser.add_argument('--seed', type=int, help='Random seed for the permutations')
+    parser.add_argument('--workers', type=int, default=1,
+                        help='Number of processes for the permutations')
+    parser.add_argument('--full_permutations', action='store_true',
+                        help='Run every permutation for every cell instead of stopping early once a '
+                             'cell is clearly (not) significant')
     
     args = parser.parse_args()
     
@@ -213,101 +388,25 @@ def main():
         print(f"Parameters: time_interval={args.time_interval}, time_step={args.time_step}, distance={args.distance}")
         
         print("Loading data...")
-        df = pd.read_csv(args.input_file)
-        
-        # Handle different possible date column names
-        if 'signal_lan' in df.columns:
-            df['date'] = pd.to_datetime(df['signal_lan'], errors='coerce')
-        elif 'date' in df.columns:
-            df['date'] = pd.to_datetime(df['date'], errors='coerce')
-        else:
-            raise ValueError("No date column found. Expected 'signal_lan' or 'date'")
-        
-        # Drop rows with invalid dates
-        df = df.dropna(subset=['date'])
-        
-        print(f"Loaded {len(df)} crime incidents")
+        df = TableCache().load(args.input_file)
         
-        # Apply date filtering if provided
-        if args.start_date or args.end_date:
-            start = args.start_date or df['date'].min()
-            end = args.end_date or df['date'].max()
-            
-            print(f"Filtering data from {start} to {end}")
-            df = df[(df['date'] >= start) & (df['date'] <= end)]
-            print(f"Filtered to {len(df)} incidents for date range")
-        
-        if len(df) == 0:
-            raise ValueError("No data available for the specified date range")
-        
-        print("Creating spatial data...")
-        # Remove rows with invalid coordinates
-        df = df.dropna(subset=['longitude', 'latitude'])
-        df = df[(df['longitude'] != 0) & (df['latitude'] != 0)]
-        
-        if len(df) == 0:
-            raise ValueError("No valid coordinates found in the data")
-        
-        gdf = gpd.GeoDataFrame(
+        run_emerging_hotspot_analysis(
             df,
-            geometry=gpd.points_from_xy(df['longitude'], df['latitude']),
-            crs="EPSG:4326"
-        ).to_crs("EPSG:32643")  # UTM Zone 43N for India
-        
-        print("Creating space-time cube...")
-        cube, grid, mk_results = create_space_time_cube(
-            gdf, 
-            time_interval=args.time_interval, 
-            cell_size=args.cell_size
-        )
-        
-        print("Detecting emerging hotspots...")
-        hotspots = detect_emerging_hotspots(
-            cube, 
-            grid,
-            mk_results,
+            start_date=args.start_date,
+            end_date=args.end_date,
+            time_interval=args.time_interval,
             time_step=args.time_step,
-            distance=args.distance
+            distance=args.distance,
+            cell_size=args.cell_size,
+            clip=args.clip,
+            clip_buffer=args.clip_buffer,
+            permutations=args.permutations,
+            seed=args.seed,
+            workers=args.workers,
+            early_stop=not args.full_permutations,
+            sweep_distances=parse_distances(args.sweep_distances),
+            sweep_statistic=args.sweep_statistic
         )
-        
-        if hotspots is not None and len(hotspots) > 0:
-            # Filter and prepare output
-            hotspots = hotspots[hotspots['crime_count'] > 0]
-            hotspots = hotspots.to_crs("EPSG:4326")
-            
-            # Add centroid coordinates for point visualization
-            centroids = hotspots.geometry.centroid
-            hotspots['latitude'] = centroids.y
-            hotspots['longitude'] = centroids.x
-            
-            keep_columns = [
-                'geometry', 'time_bin', 'crime_count',
-                'gi_score', 'p_value', 'hotspot_type', 'emerging_type',
-                'latitude', 'longitude'
-            ]
-            
-            # Only keep columns that exist
-            available_columns = [col for col in keep_columns if col in hotspots.columns]
-            hotspots = hotspots[available_columns]
-            
-            print("Saving GeoJSON...")
-            hotspots.to_file('emerging_hotspots.geojson', driver='GeoJSON')
-            
-            print("Analysis complete. Results saved to emerging_hotspots.geojson")
-            print(f"Output contains {len(hotspots)} features")
-            print(f"Hot spots: {len(hotspots[hotspots['hotspot_type'].str.contains('Hot', na=False)])}")
-            print(f"Cold spots: {len(hotspots[hotspots['hotspot_type'].str.contains('Cold', na=False)])}")
-            print(f"Intensifying patterns: {len(hotspots[hotspots['emerging_type'] == 'Intensifying'])}")
-        else:
-            print("No significant hotspots detected in the analysis period")
-            # Create empty GeoJSON
-            empty_geojson = {
-                "type": "FeatureCollection",
-                "features": []
-            }
-            with open('emerging_hotspots.geojson', 'w') as f:
-                json.dump(empty_geojson, f)
-            print("Created empty results file")
             
     except Exception as e:
         print(f"Error during analysis: {e}", file=sys.stderr)
@@ -1,171 +1,200 @@
 import pandas as pd
 import geopandas as gpd
 import numpy as np
-from shapely.geometry import Point, Polygon
-from esda.getisord import G_Local
-from libpysal.weights import DistanceBand
 import argparse
 import sys
 import os
+from processors.incident_input import GROUP_BY_COLUMNS, load_incident_input
+from processors.grid_mask import GridMask, CLIP_MODES
+from processors.getis_ord import LocalG
+from processors.lattice_weights import lattice_weights
+from processors.distance_sweep import distance_sweep, peak_distance, parse_distances, SWEEP_STATISTICS
+from utils.grid_utils import cell_edges, interior_cells, cell_polygons
+from utils.projection_utils import to_projected, UTM_43N
 
-def perform_hotspot_analysis(start_date=None, end_date=None):
+OUTPUT_COLUMNS = ['latitude', 'longitude', 'gi_star', 'p_value', 'hotspot_category', 'weight_sum']
+
+# Distance band of the spatial weights in meters, unless set or chosen by a sweep
+DEFAULT_DISTANCE = 500
+
+def bin_incidents(df, clip='none', clip_buffer=1000, cell_size=200):
+    """Cell of each incident on a grid over the study area
+
+    Returns the x and y cell edges and each incident's cell id (i * ny + j,
+    the grid's column-by-column order). Incidents on a cell edge or beyond
+    the last whole cell fall in no cell (id -1), as with a 'contains' join
+    on the cells, and so do those in cells outside the clip area.
+    """
+    # Transform to projected CRS
+    x, y = to_projected(df['longitude'], df['latitude'])
+    
+    # Get study area bounds
+    minx, miny, maxx, maxy = x.min(), y.min(), x.max(), y.max()
+    print(f"Study area bounds: {minx}, {miny}, {maxx}, {maxy}")
+    
+    # Create grid
+    nx = int((maxx - minx) / cell_size)
+    ny = int((maxy - miny) / cell_size)
+    x_edges = cell_edges(minx, cell_size, nx)
+    y_edges = cell_edges(miny, cell_size, ny)
+    
+    cell_i = interior_cells(x, x_edges)
+    cell_j = interior_cells(y, y_edges)
+    counted = (cell_i >= 0) & (cell_j >= 0)
+    
+    grid_mask = GridMask.from_clip(clip, x, y, clip_buffer)
+    if grid_mask is not None:
+        cell_mask = grid_mask.inside((x_edges[:-1] + x_edges[1:]) / 2, (y_edges[:-1] + y_edges[1:]) / 2)
+        print(f"Clip '{clip}': {grid_mask.describe(cell_mask)}")
+        counted[counted] = cell_mask[cell_i[counted], cell_j[counted]]
+    
+    return x_edges, y_edges, np.where(counted, cell_i * ny + cell_j, -1)
+
+def incident_weights(df):
+    """Each incident's normalized AHP weight (0 where it is missing)"""
+    if 'ahp_weighted_event_types_nor_weight' in df.columns:
+        return np.nan_to_num(df['ahp_weighted_event_types_nor_weight'].to_numpy(dtype=float))
+    return np.zeros(len(df))
+
+def hotspot_weights(cell_id, x_edges, y_edges, distance=DEFAULT_DISTANCE, cell_size=200):
+    """Inverse-square distance-band weights between the given cells, from their lattice positions"""
+    nx, ny = len(x_edges) - 1, len(y_edges) - 1
+    cell_i, cell_j = np.divmod(cell_id, ny)
+    return lattice_weights(cell_i, cell_j, (nx, ny), cell_size, threshold=distance, binary=False, alpha=-2.0)
+
+def sweep_distance(cell_id, x_edges, y_edges, y, distances, statistic='moran', cell_size=200):
+    """Print the global autocorrelation of the cell values over the distance bands and return the peak band
+
+    The sweep scores binary distance-band weights (see distance_sweep),
+    while the Gi run the peak band feeds weights neighbours by inverse
+    squared distance (see hotspot_weights); the band only sets its reach.
+    """
+    cell_i, cell_j = np.divmod(cell_id, len(y_edges) - 1)
+    sweep = distance_sweep(cell_i, cell_j, (len(x_edges) - 1, len(y_edges) - 1), cell_size, y, distances, statistic)
+    print(f"Distance sweep ({statistic}):")
+    print(sweep.to_string(index=False))
+    peak = peak_distance(sweep)
+    print(f"Peak distance band: {peak} m" if peak is not None else "No peak distance band found")
+    return peak
+
+def cell_centers(cell_id, x_edges, y_edges):
+    """WGS84 (longitude, latitude) of the centroids of the given cells, as the cell polygons give them"""
+    cell_i, cell_j = np.divmod(cell_id, len(y_edges) - 1)
+    polygons = gpd.GeoSeries(cell_polygons(x_edges, y_edges, cell_i, cell_j), crs=UTM_43N).to_crs("EPSG:4326")
+    centroids = polygons.centroid
+    return centroids.x.values, centroids.y.values
+
+def classify_hotspots(gi_star, p_value):
+    """Hotspot sign (1 hot, -1 cold, NaN otherwise) and category label of each cell"""
+    # Classify hotspots
+    alpha = 0.05
+    hotspot = np.where(p_value <= alpha, np.sign(gi_star), np.nan)
+    
+    # Create categories
+    conditions = [
+        (hotspot == 1) & (p_value <= 0.01),
+        (hotspot == 1) & (p_value <= 0.05),
+        (hotspot == 1) & (p_value <= 0.1),
+        (hotspot == -1) & (p_value <= 0.01),
+        (hotspot == -1) & (p_value <= 0.05),
+        (hotspot == -1) & (p_value <= 0.1),
+        (p_value > 0.1)
+    ]
+    
+    categories = [
+        'Hot Spot (99% Confidence)',
+        'Hot Spot (95% Confidence)',
+        'Hot Spot (90% Confidence)',
+        'Cold Spot (99% Confidence)',
+        'Cold Spot (95% Confidence)',
+        'Cold Spot (90% Confidence)',
+        'Not Significant'
+    ]
+    
+    return hotspot, np.select(conditions, categories, default='Not Significant')
+
+def perform_hotspot_analysis(start_date=None, end_date=None, df=None, output_path=None,
+                             clip='none', clip_buffer=1000, permutations=0, seed=None, workers=1,
+                             early_stop=True, distance=None, sweep_distances=None, sweep_statistic='moran'):
+    """Run the Getis-Ord hotspot analysis on a 200 m grid of incident weights and save the results
+
+    df is an in-memory incident table (e.g. from analytics.load_incidents);
+    when omitted the table is read from filtered_data.csv next to this script.
+    clip leaves out grid cells outside the city boundary and/or the
+    incidents' hull grown by clip_buffer meters (see GridMask).
+    p_value is the analytic normal p-value of the Gi z-score; with
+    permutations > 0 it is the conditional permutation pseudo p-value
+    instead, computed on `workers` processes and, with early_stop, cut
+    short for cells that are clearly (not) significant (see LocalG).
+    Neighbours are the cells within `distance` meters (default 500). With
+    sweep_distances, global Moran's I or General G is first computed for
+    each of those bands (see distance_sweep) and, unless a distance is
+    given, the peak band is used.
+    """
     try:
         # Get the directory where this script is located
         script_dir = os.path.dirname(os.path.abspath(__file__))
         csv_path = os.path.join(script_dir, 'filtered_data.csv')
-        output_path = os.path.join(script_dir, 'hotspot_analysis_results.csv')
+        output_path = output_path or os.path.join(script_dir, 'hotspot_analysis_results.csv')
         
         print(f"Script directory: {script_dir}")
-        print(f"Looking for CSV at: {csv_path}")
         print(f"Will save results to: {output_path}")
         
-        # Check if input file exists
-        if not os.path.exists(csv_path):
-            print(f"Error: Input CSV file not found at {csv_path}")
+        df = load_incident_input(start_date, end_date, df, csv_path)
+        if df is None:
             return False
         
-        # Read the CSV file
-        df = pd.read_csv(csv_path)
-        print(f"Loaded {len(df)} rows from CSV")
+        x_edges, y_edges, incident_cells = bin_incidents(df, clip, clip_buffer)
         
-        # Filter by date range if provided
-        if start_date and end_date:
-            if 'date' in df.columns:
-                df['date'] = pd.to_datetime(df['date'])
-                df = df[(df['date'] >= start_date) & (df['date'] <= end_date)]
-                print(f"Filtered data: {len(df)} records between {start_date} and {end_date}")
+        # Aggregate weights per cell id
+        counted = incident_cells >= 0
+        weight_sum = np.bincount(
+            incident_cells[counted],
+            weights=incident_weights(df)[counted],
+            minlength=(len(x_edges) - 1) * (len(y_edges) - 1)
+        )
         
-        if len(df) == 0:
-            print("No data available for the specified date range")
-            return False
+        # Filter populated cells; polygons are only built for these
+        cell_id = np.flatnonzero(weight_sum > 0)
+        print(f"Number of populated grid cells: {len(cell_id)}")
         
-        # Create geometry and GeoDataFrame
-        geometry = [Point(xy) for xy in zip(df['longitude'], df['latitude'])]
-        gdf = gpd.GeoDataFrame(df, geometry=geometry, crs="EPSG:4326")
-        
-        # Transform to projected CRS
-        gdf = gdf.to_crs("EPSG:32643")
-        
-        # Get study area bounds
-        minx, miny, maxx, maxy = gdf.total_bounds
-        print(f"Study area bounds: {minx}, {miny}, {maxx}, {maxy}")
-        
-        # Create grid
-        cell_size = 200
-        nx = int((maxx - minx) / cell_size)
-        ny = int((maxy - miny) / cell_size)
-        
-        grid_cells = []
-        for i in range(nx):
-            for j in range(ny):
-                x0 = minx + i * cell_size
-                y0 = miny + j * cell_size
-                x1 = minx + (i + 1) * cell_size
-                y1 = miny + (j + 1) * cell_size
-                grid_cells.append(Polygon([(x0, y0), (x1, y0), (x1, y1), (x0, y1)]))
-        
-        grid = gpd.GeoDataFrame({'geometry': grid_cells}, crs=gdf.crs)
-        grid['cell_id'] = range(len(grid))
-        
-        # Spatial join
-        spatial_join = gpd.sjoin(grid, gdf, how="left", predicate="contains")
-        
-        # Aggregate weights
-        try:
-            grid_stats = spatial_join.groupby('index_left')['ahp_weighted_event_types_nor_weight'].sum().fillna(0)
-        except KeyError:
-            try:
-                grid_stats = spatial_join.groupby('cell_id')['ahp_weighted_event_types_nor_weight'].sum().fillna(0)
-            except KeyError:
-                grid_stats = spatial_join.groupby(level=0)['ahp_weighted_event_types_nor_weight'].sum().fillna(0)
-        
-        # Add weights to grid
-        grid['weight_sum'] = 0
-        for idx, weight in grid_stats.items():
-            if isinstance(idx, tuple):
-                idx = idx[0]
-            if idx in grid.index:
-                grid.loc[idx, 'weight_sum'] = weight
-            elif 'cell_id' in grid.columns and idx in grid['cell_id'].values:
-                grid.loc[grid['cell_id'] == idx, 'weight_sum'] = weight
-        
-        # Filter populated cells
-        grid_populated = grid[grid['weight_sum'] > 0].copy()
-        print(f"Number of populated grid cells: {len(grid_populated)}")
-        
-        if len(grid_populated) < 3:
+        if len(cell_id) < 3:
             print("Not enough populated cells for hotspot analysis")
             return False
         
-        # Create centroids for spatial weights
-        grid_populated['centroid'] = grid_populated.geometry.centroid
-        grid_populated_pts = grid_populated.copy()
-        grid_populated_pts.geometry = grid_populated_pts.centroid
-        
-        # Calculate spatial weights
-        weights = DistanceBand.from_dataframe(
-            grid_populated_pts, 
-            threshold=500, 
-            binary=False,
-            alpha=-2.0,
-            silence_warnings=True
-        )
-        
-        # Perform Getis-Ord analysis
-        y = grid_populated['weight_sum'].values
-        g_local = G_Local(y, weights)
-        
-        grid_populated['gi_star'] = g_local.Zs
-        grid_populated['p_value'] = g_local.p_sim
-        grid_populated['hotspot'] = np.nan
-        
-        # Classify hotspots
-        alpha = 0.05
-        grid_populated.loc[grid_populated['p_value'] <= alpha, 'hotspot'] = np.sign(
-            grid_populated.loc[grid_populated['p_value'] <= alpha, 'gi_star']
-        )
-        
-        # Create categories
-        conditions = [
-            (grid_populated['hotspot'] == 1) & (grid_populated['p_value'] <= 0.01),
-            (grid_populated['hotspot'] == 1) & (grid_populated['p_value'] <= 0.05),
-            (grid_populated['hotspot'] == 1) & (grid_populated['p_value'] <= 0.1),
-            (grid_populated['hotspot'] == -1) & (grid_populated['p_value'] <= 0.01),
-            (grid_populated['hotspot'] == -1) & (grid_populated['p_value'] <= 0.05),
-            (grid_populated['hotspot'] == -1) & (grid_populated['p_value'] <= 0.1),
-            (grid_populated['p_value'] > 0.1)
-        ]
-        
-        categories = [
-            'Hot Spot (99% Confidence)',
-            'Hot Spot (95% Confidence)',
-            'Hot Spot (90% Confidence)',
-            'Cold Spot (99% Confidence)',
-            'Cold Spot (95% Confidence)',
-            'Cold Spot (90% Confidence)',
-            'Not Significant'
-        ]
-        
-        grid_populated['hotspot_category'] = np.select(conditions, categories, default='Not Significant')
-        
-        # Transform back to WGS84
-        grid_populated = grid_populated.to_crs("EPSG:4326")
-        
-        # Calculate centroids and extract lat/lng for heatmap
-        centroids = grid_populated.geometry.centroid
-        grid_populated['longitude'] = centroids.x
-        grid_populated['latitude'] = centroids.y
-        
-        # Create output CSV with latitude/longitude columns for direct heatmap use
-        output_df = grid_populated[['latitude', 'longitude', 'gi_star', 'p_value', 'hotspot_category', 'weight_sum']]
+        if sweep_distances:
+            peak = sweep_distance(cell_id, x_edges, y_edges, weight_sum[cell_id], sweep_distances, sweep_statistic)
+            distance = distance or peak
+        distance = distance or DEFAULT_DISTANCE
+        print(f"Distance band: {distance} m")
+        
+        # Perform Getis-Ord analysis; p-values are analytic unless permutations are asked for
+        g_local = LocalG(weight_sum[cell_id], hotspot_weights(cell_id, x_edges, y_edges, distance),
+                         permutations=permutations, seed=seed, workers=workers, early_stop=early_stop)
+        if permutations:
+            print(f"Permutations per cell: {g_local.permutations_run.mean():.0f} on average (up to {permutations})")
+        
+        p_value = g_local.p_sim if permutations else g_local.p_norm
+        hotspot, hotspot_category = classify_hotspots(g_local.Zs, p_value)
+        
+        # Cell centroids in WGS84 as latitude/longitude columns for direct heatmap use
+        longitude, latitude = cell_centers(cell_id, x_edges, y_edges)
+        output_df = pd.DataFrame({
+            'latitude': latitude,
+            'longitude': longitude,
+            'gi_star': g_local.Zs,
+            'p_value': p_value,
+            'hotspot_category': hotspot_category,
+            'weight_sum': weight_sum[cell_id]
+        })
         
         # Save results to the backend directory
         output_df.to_csv(output_path, index=False)
         
         print(f"Hotspot analysis complete. Results saved to {output_path}")
         print(f"File size: {os.path.getsize(output_path)} bytes")
-        print(f"Total hotspots found: {len(grid_populated[grid_populated['hotspot'] == 1])}")
-        print(f"Total coldspots found: {len(grid_populated[grid_populated['hotspot'] == -1])}")
+        print(f"Total hotspots found: {int((hotspot == 1).sum())}")
+        print(f"Total coldspots found: {int((hotspot == -1).sum())}")
         
         # Show first few rows
         print("First few rows of output:")
@@ -185,12 +214,147 @@ def perform_hotspot_analysis(start_date=None, end_date=None):
         traceback.print_exc()
         return False
 
+def perform_category_hotspot_analysis(by, start_date=None, end_date=None, df=None, output_path=None,
+                                      clip='none', clip_buffer=1000, permutations=0, seed=None, workers=1,
+                                      early_stop=True, distance=None, sweep_distances=None,
+                                      sweep_statistic='moran'):
+    """Hotspots per category of `by` (a GROUP_BY_COLUMNS key) from one grid and one weights matrix
+
+    Incident weights are summed into a cells x categories matrix over the
+    cells any category populates, and Gi is computed for every column in
+    one sparse product with the shared weights (see LocalG). A category's
+    empty cells among those count as zeros, so its results can differ
+    from a run on that category alone. Each category's populated cells
+    are saved together in one CSV with a `category` column, by default
+    hotspot_analysis_results_by_<by>.csv. The distance band is chosen as
+    in perform_hotspot_analysis, with the sweep run on the cells' weights
+    summed over all categories, so every category shares the band.
+    """
+    try:
+        script_dir = os.path.dirname(os.path.abspath(__file__))
+        csv_path = os.path.join(script_dir, 'filtered_data.csv')
+        output_path = output_path or os.path.join(script_dir, f'hotspot_analysis_results_by_{by}.csv')
+        category_column = GROUP_BY_COLUMNS[by]
+        print(f"Will save {by} hotspots to: {output_path}")
+        
+        df = load_incident_input(start_date, end_date, df, csv_path)
+        if df is None:
+            return False
+        df = df[df[category_column].notna()]
+        
+        x_edges, y_edges, incident_cells = bin_incidents(df, clip, clip_buffer)
+        codes, labels = pd.factorize(df[category_column], sort=True)
+        
+        # Aggregate weights per cell id and category
+        counted = incident_cells >= 0
+        weight_sum = np.bincount(
+            incident_cells[counted] * len(labels) + codes[counted],
+            weights=incident_weights(df)[counted],
+            minlength=(len(x_edges) - 1) * (len(y_edges) - 1) * len(labels)
+        ).reshape(-1, len(labels))
+        
+        # Categories need at least three populated cells, as a single run does
+        populated = weight_sum > 0
+        kept = populated.sum(axis=0) >= 3
+        if not kept.all():
+            print(f"Skipping categories with fewer than 3 populated cells: {', '.join(map(str, labels[~kept]))}")
+        if not kept.any():
+            print("Not enough populated cells for hotspot analysis")
+            return False
+        labels, weight_sum, populated = labels[kept], weight_sum[:, kept], populated[:, kept]
+        
+        cell_id = np.flatnonzero(populated.any(axis=1))
+        weight_sum, populated = weight_sum[cell_id], populated[cell_id]
+        print(f"Number of populated grid cells: {len(cell_id)} across {len(labels)} {by} categories")
+        
+        if sweep_distances:
+            peak = sweep_distance(cell_id, x_edges, y_edges, weight_sum.sum(axis=1), sweep_distances, sweep_statistic)
+            distance = distance or peak
+        distance = distance or DEFAULT_DISTANCE
+        print(f"Distance band: {distance} m")
+        
+        g_local = LocalG(weight_sum, hotspot_weights(cell_id, x_edges, y_edges, distance),
+                         permutations=permutations, seed=seed, workers=workers, early_stop=early_stop)
+        p_value = g_local.p_sim if permutations else g_local.p_norm
+        hotspot, hotspot_category = classify_hotspots(g_local.Zs, p_value)
+        longitude, latitude = cell_centers(cell_id, x_edges, y_edges)
+        
+        layers = []
+        for k, label in enumerate(labels):
+            rows = populated[:, k]
+            print(f"{label}: {rows.sum()} cells, {int((hotspot[rows, k] == 1).sum())} hotspots, "
+                  f"{int((hotspot[rows, k] == -1).sum())} coldspots")
+            layers.append(pd.DataFrame({
+                'category': label,
+                'latitude': latitude[rows],
+                'longitude': longitude[rows],
+                'gi_star': g_local.Zs[rows, k],
+                'p_value': p_value[rows, k],
+                'hotspot_category': hotspot_category[rows, k],
+                'weight_sum': weight_sum[rows, k]
+            }))
+        
+        output_df = pd.concat(layers, ignore_index=True)[['category'] + OUTPUT_COLUMNS]
+        output_df.to_csv(output_path, index=False)
+        print(f"Category hotspot analysis complete. {len(output_df)} cells saved to {output_path}")
+        return True
+        
+    except Exception as e:
+        print(f"Error in category hotspot analysis: {str(e)}")
+        import traceback
+        traceback.print_exc()
+        return False
+
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(description='Perform hotspot analysis')
     parser.add_argument('--start-date', type=str, help='Start date (YYYY-MM-DD)')
     parser.add_argument('--end-date', type=str, help='End date (YYYY-MM-DD)')
+    parser.add_argument('--by', type=str, choices=list(GROUP_BY_COLUMNS),
+                        help='Map hotspots per main type or severity label in a single run '
+                             '(saved to hotspot_analysis_results_by_<by>.csv)')
+    parser.add_argument('--distance', type=float,
+                        help=f'Distance band of the spatial weights in meters (default: {DEFAULT_DISTANCE}, '
+                             'or the peak of --sweep-distances)')
+    parser.add_argument('--sweep-distances', type=str,
+                        help='Comma-separated distance bands in meters to sweep global autocorrelation over '
+                             'before the run, e.g. 300,400,500,750,1000')
+    parser.add_argument('--sweep-statistic', type=str, choices=SWEEP_STATISTICS, default='moran',
+                        help="Global statistic for --sweep-distances: Moran's I or General G (default: moran)")
+    parser.add_argument('--clip', type=str, choices=CLIP_MODES, default='none',
+                        help='Only build grid cells inside the city boundary, the buffered incident hull, '
+                             'or both (default: none)')
+    parser.add_argument('--clip-buffer', type=float, default=1000,
+                        help='Buffer around the incident hull in meters for --clip hull/both (default: 1000)')
+    
+    parser.add_argument('--permutations', type=int, default=0,
+                        help='Permutations for pseudo p-values; 0 uses analytic normal p-values (default: 0)')
+    parser.add_argument('--seed', type=int, help='Random seed for the permutations')
+    parser.add_argument('--workers', type=int, default=1,
+                        help='Number of processes for the permutations (default: 1)')
+    parser.add_argument('--full-permutations', action='store_true',
+                        help='Run every permutation for every cell instead of stopping early once a '
+                             'cell is clearly (not) significant')
     
     args = parser.parse_args()
     
-    success = perform_hotspot_analysis(args.start_date, args.end_date)
+    if args.by:
+        success = perform_category_hotspot_analysis(
+            args.by, args.start_date, args.end_date,
+            clip=args.clip,
+            clip_buffer=args.clip_buffer,
+            permutations=args.permutations,
+            seed=args.seed,
+            workers=args.workers,
+            early_stop=not args.full_permutations,
+            distance=args.distance,
+            sweep_distances=parse_distances(args.sweep_distances),
+            sweep_statistic=args.sweep_statistic
+        )
+        sys.exit(0 if success else 1)
+    
+    success = perform_hotspot_analysis(args.start_date, args.end_date, clip=args.clip, clip_buffer=args.clip_buffer,
+                                       permutations=args.permutations, seed=args.seed, workers=args.workers,
+                                       early_stop=not args.full_permutations, distance=args.distance,
+                                       sweep_distances=parse_distances(args.sweep_distances),
+                                       sweep_statistic=args.sweep_statistic)
     sys.exit(0 if success else 1)
\ No newline at end of file
@@ -1,172 +1,295 @@
 import pandas as pd
-import geopandas as gpd
-from shapely.geometry import Point, Polygon
 import numpy as np
-from scipy.stats import gaussian_kde
+import shapely
 import argparse
 import sys
 import os
+import json
+import shutil
+from processors.incident_input import GROUP_BY_COLUMNS, load_incident_input
+from processors.grid_mask import GridMask, CLIP_MODES
+from processors.kde_engine import BinnedKDE, CategoryKDE, ExactKDE, TreeKDE, TiledKDE, decimate_binned
+from utils.projection_utils import to_projected, to_wgs84
 
-def perform_kde_analysis(start_date=None, end_date=None):
+OUTPUT_COLUMNS = ['latitude', 'longitude', 'kde_value', 'kde_normalized', 'kde_weight', 'percentile', 'density_category']
+
+# Density categories from highest to lowest, by percentile rank of the kept cells
+DENSITY_CATEGORIES = [
+    'Extreme High Density',
+    'Very High Density',
+    'High Density',
+    'Medium Density',
+    'Low Density'
+]
+
+def density_cells(z, x_range, y_range, threshold_percentile=90, cell_mask=None):
+    """Grid cells above the density percentile, with weight fields, categories and WGS84 centers
+
+    With a cell_mask (indexed [i, j], see GridMask.node_cells) only the cells
+    inside it are ranked and kept. Returns the cells (None if there are
+    none) and the threshold value.
+    """
+    # Cell (i, j) takes the value of its lower-left node; transposed so the
+    # selected cells come out ordered by i, then j
+    cell_values = z[:-1, :-1].T
+    if cell_mask is None:
+        threshold = np.percentile(z, threshold_percentile)
+        cell_i, cell_j = np.nonzero(cell_values > threshold)
+    elif not cell_mask.any():
+        return None, np.nan
+    else:
+        threshold = np.percentile(cell_values[cell_mask], threshold_percentile)
+        cell_i, cell_j = np.nonzero((cell_values > threshold) & cell_mask)
+    
+    if len(cell_i) == 0:
+        return None, threshold
+    
+    # Create DataFrame with the filtered results and their cell center coordinates
+    result_df = pd.DataFrame({
+        'cell_i': cell_i,
+        'cell_j': cell_j,
+        'x_projected': (x_range[cell_i] + x_range[cell_i + 1]) / 2,
+        'y_projected': (y_range[cell_j] + y_range[cell_j + 1]) / 2,
+        'kde_value': cell_values[cell_i, cell_j]
+    })
+    
+    # Create a more discriminating weight field using log transformation
+    # This will amplify differences between high and low density areas
+    min_val = result_df['kde_value'].min()
+    max_val = result_df['kde_value'].max()
+    
+    # Log transform to spread out the values more
+    result_df['kde_log'] = np.log10(result_df['kde_value'] + 1e-10)  # Add small value to avoid log(0)
+    
+    # Normalize the log values
+    log_min = result_df['kde_log'].min()
+    log_max = result_df['kde_log'].max()
+    result_df['kde_log_normalized'] = (result_df['kde_log'] - log_min) / (log_max - log_min)
+    
+    # Create an exponential weight that emphasizes high-density areas
+    result_df['kde_weight'] = np.power(result_df['kde_log_normalized'], 2) * 100  # Square for more contrast
+    
+    # Regular normalized version
+    result_df['kde_normalized'] = (result_df['kde_value'] - min_val) / (max_val - min_val)
+    
+    # Add percentile ranks within the filtered data
+    result_df['percentile'] = result_df['kde_value'].rank(pct=True) * 100
+    
+    # Create more distinct categories based on percentiles
+    conditions = [
+        (result_df['percentile'] >= 95),   # Top 5%
+        (result_df['percentile'] >= 80) & (result_df['percentile'] < 95),   # Next 15%
+        (result_df['percentile'] >= 60) & (result_df['percentile'] < 80),   # Next 20%
+        (result_df['percentile'] >= 40) & (result_df['percentile'] < 60),   # Next 20%
+        (result_df['percentile'] < 40)    # Bottom 40%
+    ]
+    result_df['density_category'] = np.select(conditions, DENSITY_CATEGORIES, default='Low Density')
+    
+    # Convert projected coordinates back to WGS84 for Kepler.gl
+    result_df['longitude'], result_df['latitude'] = to_wgs84(result_df['x_projected'], result_df['y_projected'])
+    
+    return result_df, threshold
+
+def density_isobands(cells, x_range, y_range, simplify_tolerance=None):
+    """GeoJSON FeatureCollection with one WGS84 (multi)polygon per density category
+
+    Each band is the union of its category's cells (the same cells and
+    percentile breaks as the CSV), with the staircase outline simplified by
+    simplify_tolerance meters (default: half a cell) and coordinates rounded
+    to about 0.1 m. One feature per band replaces thousands of point rows.
+    """
+    cell_size = x_range[1] - x_range[0] if len(x_range) > 1 else 1.0
+    tolerance = cell_size / 2 if simplify_tolerance is None else simplify_tolerance
+    features = []
+    for rank, category in enumerate(DENSITY_CATEGORIES):
+        band_cells = cells[cells['density_category'] == category]
+        if len(band_cells) == 0:
+            continue
+        # Boxes from the grid nodes share their edges exactly, so the coverage union is seamless
+        i, j = band_cells['cell_i'].values, band_cells['cell_j'].values
+        band = shapely.coverage_union_all(shapely.box(x_range[i], y_range[j], x_range[i + 1], y_range[j + 1]))
+        if tolerance > 0:
+            band = shapely.simplify(band, tolerance, preserve_topology=True)
+        band = shapely.transform(band, lambda coords: np.column_stack(to_wgs84(coords[:, 0], coords[:, 1])))
+        band = shapely.set_precision(band, 1e-6)
+        features.append({
+            'type': 'Feature',
+            'properties': {
+                'density_category': category,
+                'rank': rank,
+                'cells': len(band_cells),
+                'kde_min': float(band_cells['kde_value'].min()),
+                'kde_max': float(band_cells['kde_value'].max()),
+                'kde_weight_mean': float(band_cells['kde_weight'].mean())
+            },
+            'geometry': json.loads(shapely.to_geojson(band))
+        })
+    return {'type': 'FeatureCollection', 'features': features}
+
+def node_mask(cell_mask):
+    """KDE node mask (like np.meshgrid) from a cell mask: each cell is valued at its lower-left node"""
+    nodes = np.zeros((cell_mask.shape[1] + 1, cell_mask.shape[0] + 1), dtype=bool)
+    nodes[:-1, :-1] = cell_mask.T
+    return nodes
+
+def write_tile_pyramid(kde, bounds, tile_dir, min_cell_size=50, levels=6, tile_cells=128, grid_mask=None):
+    """Write density tiles at min_cell_size * 2^k meters for k < levels
+
+    The incidents are binned once at the finest level and each coarser level
+    is decimated from the one below (see decimate_binned), so a level costs
+    one convolution. Every level is cut into tiles of tile_cells x tile_cells
+    cells, written as <cell size>m/<tx>_<ty>.csv with the main output columns;
+    index.json lists each tile's WGS84 bounding box for viewport lookups.
+    A grid_mask clips every level to its area.
+    """
+    minx, miny, maxx, maxy = bounds
+    nx = int(np.ceil((maxx - minx) / min_cell_size)) + 1
+    ny = int(np.ceil((maxy - miny) / min_cell_size)) + 1
+    binned = kde.bin_weights(minx + np.arange(nx) * min_cell_size, miny + np.arange(ny) * min_cell_size)
+    
+    # Build next to the old pyramid and swap it in, so readers never see a partial one
+    build_dir = tile_dir + '.tmp'
+    shutil.rmtree(build_dir, ignore_errors=True)
+    os.makedirs(build_dir)
+    index = {'tile_cells': tile_cells, 'columns': OUTPUT_COLUMNS, 'levels': []}
+    
+    for level in range(levels):
+        if level:
+            binned = decimate_binned(binned)
+        cell_size = min_cell_size * 2**level
+        x_range = minx + np.arange(binned.shape[1]) * cell_size
+        y_range = miny + np.arange(binned.shape[0]) * cell_size
+        z = kde.convolve(binned, cell_size, cell_size)
+        cell_mask = grid_mask.node_cells(x_range, y_range) if grid_mask is not None else None
+        cells, _ = density_cells(z, x_range, y_range, cell_mask=cell_mask)
+        
+        level_dir = f"{cell_size:g}m"
+        tiles = []
+        if cells is not None:
+            os.makedirs(os.path.join(build_dir, level_dir))
+            tile_size = tile_cells * cell_size
+            for (tx, ty), tile in cells.groupby([cells['cell_i'] // tile_cells, cells['cell_j'] // tile_cells]):
+                file_name = f"{level_dir}/{tx}_{ty}.csv"
+                tile[OUTPUT_COLUMNS].to_csv(os.path.join(build_dir, file_name), index=False)
+                
+                # Bounding box of the projected tile square's corners
+                x0, y0 = minx + tx * tile_size, miny + ty * tile_size
+                lon, lat = to_wgs84([x0, x0 + tile_size, x0, x0 + tile_size], [y0, y0, y0 + tile_size, y0 + tile_size])
+                tiles.append({
+                    'file': file_name,
+                    'bbox': [float(lon.min()), float(lat.min()), float(lon.max()), float(lat.max())],
+                    'cells': len(tile)
+                })
+        
+        index['levels'].append({
+            'cell_size': float(cell_size),
+            'error_bound': float(kde.error_bound(x_range, y_range)),
+            'tiles': tiles
+        })
+        print(f"Tile level {cell_size:g} m: {len(x_range)}x{len(y_range)} grid, "
+              f"{0 if cells is None else len(cells)} cells in {len(tiles)} tiles")
+    
+    with open(os.path.join(build_dir, 'index.json'), 'w') as f:
+        json.dump(index, f)
+    shutil.rmtree(tile_dir, ignore_errors=True)
+    os.replace(build_dir, tile_dir)
+    print(f"KDE tile pyramid saved to {tile_dir}")
+
+def perform_kde_analysis(start_date=None, end_date=None, df=None, output_path=None, kde_method='fft',
+                         cell_size=200, kde_cutoff=4.0, kde_atol=None, kde_rtol=1e-3,
+                         tile_min_cell=50, tile_levels=0, workers=1, max_memory_mb=None,
+                         clip='none', clip_buffer=1000, isobands=False, isoband_simplify=None):
+    """Estimate crime density on a 200 m grid and save the high-density cells
+
+    df is an in-memory incident table (e.g. from analytics.load_incidents);
+    when omitted the table is read from ps_removed_dt.csv next to this script.
+    kde_method 'fft' bins the incidents and convolves (see BinnedKDE); 'tree'
+    sums a truncated kernel over nearby incidents to within kde_atol/kde_rtol
+    (see TreeKDE); 'exact' evaluates gaussian_kde at every grid node.
+    The grid is evaluated in tiles on `workers` processes, sized to keep the
+    evaluation under max_memory_mb (see TiledKDE). clip restricts evaluation
+    and output to cells inside the city boundary and/or the incidents' hull
+    grown by clip_buffer meters (see GridMask).
+    With tile_levels > 0 (off by default, as it costs more than the
+    surface itself) a multi-resolution tile pyramid is also written to
+    kde_tiles/ next to the output (see write_tile_pyramid). With isobands
+    the cells are also saved as category polygons to kde_isobands.geojson
+    (see density_isobands).
+    """
     try:
         # Get the directory where this script is located
         script_dir = os.path.dirname(os.path.abspath(__file__))
         csv_path = os.path.join(script_dir, 'ps_removed_dt.csv')
-        output_path = os.path.join(script_dir, 'kde_analysis_results.csv')
+        output_path = output_path or os.path.join(script_dir, 'kde_analysis_results.csv')
         
         print(f"Script directory: {script_dir}")
-        print(f"Looking for CSV at: {csv_path}")
         print(f"Will save results to: {output_path}")
         
-        # Check if input file exists
-        if not os.path.exists(csv_path):
-            print(f"Error: Input CSV file not found at {csv_path}")
-            return False
-        
-        # Read the CSV file
-        df = pd.read_csv(csv_path)
-        print(f"Loaded {len(df)} rows from CSV")
-        
-        # Filter by date range if provided
-        if start_date and end_date:
-            if 'date' in df.columns:
-                df['date'] = pd.to_datetime(df['date'])
-                df = df[(df['date'] >= start_date) & (df['date'] <= end_date)]
-                print(f"Filtered data: {len(df)} records between {start_date} and {end_date}")
-        
-        if len(df) == 0:
-            print("No data available for the specified date range")
+        df = load_incident_input(start_date, end_date, df, csv_path)
+        if df is None:
             return False
         
         print("Loading data...")
-        geometry = [Point(xy) for xy in zip(df['longitude'], df['latitude'])]
-        gdf = gpd.GeoDataFrame(df, geometry=geometry, crs="EPSG:4326")
-        
         # Transform to projected CRS for accurate distance calculations
-        gdf = gdf.to_crs("EPSG:32643")
-        
-        coords = np.vstack([gdf.geometry.x, gdf.geometry.y])
+        x, y = to_projected(df['longitude'], df['latitude'])
+        coords = np.vstack([x, y])
         
-        minx, miny, maxx, maxy = gdf.total_bounds
+        minx, miny, maxx, maxy = x.min(), y.min(), x.max(), y.max()
         print(f"Study area bounds: {minx}, {miny}, {maxx}, {maxy}")
         
-        # Use smaller cell size for finer resolution
-        cell_size = 200  # Smaller cells for better detail
+        print(f"Grid cell size: {cell_size} m")
         
         x_range = np.arange(minx, maxx + cell_size, cell_size)
         y_range = np.arange(miny, maxy + cell_size, cell_size)
-        x_grid, y_grid = np.meshgrid(x_range, y_range)
+        
+        grid_mask = GridMask.from_clip(clip, x, y, clip_buffer)
+        cell_mask = grid_mask.node_cells(x_range, y_range) if grid_mask is not None else None
+        if cell_mask is not None:
+            print(f"Clip '{clip}': {grid_mask.describe(cell_mask)}")
         
         print("Performing Kernel Density Estimation...")
-        positions = np.vstack([x_grid.ravel(), y_grid.ravel()])
         
         # Use weights if available, otherwise use simple count-based KDE
         try:
-            weights = gdf['ahp_weighted_event_types_nor_weight'].values
-            kde = gaussian_kde(coords, weights=weights)
+            weights = df['ahp_weighted_event_types_nor_weight'].values
             print("Using weighted KDE")
         except (KeyError, AttributeError):
-            kde = gaussian_kde(coords)
+            weights = None
             print("Using unweighted KDE")
         
-        # Calculate KDE values for all grid points
-        z = kde(positions)
+        if kde_method == 'fft':
+            # Bin onto the grid and convolve: cost depends on the grid size, not the incident count
+            kde = BinnedKDE(coords, weights=weights)
+            print(f"Binned FFT KDE on {len(x_range)}x{len(y_range)} grid "
+                  f"(max abs error vs exact: {kde.error_bound(x_range, y_range):.3e})")
+        elif kde_method == 'tree':
+            # Only incidents within the cutoff of a node are visited
+            kde = TreeKDE(coords, weights=weights, cutoff=kde_cutoff, atol=kde_atol, rtol=kde_rtol)
+            print(f"Tree KDE with {kde_cutoff}-bandwidth cutoff on {len(x_range)}x{len(y_range)} grid "
+                  f"(abs error vs exact <= {kde.atol:.3e} + {kde.rtol:g} x density)")
+        else:
+            kde = ExactKDE(coords, weights=weights)
         
-        # Reshape the result to match the grid
-        z = z.reshape(x_grid.shape)
+        # Calculate KDE values for all grid points, tile by tile
+        z = TiledKDE(kde, workers=workers, max_memory_mb=max_memory_mb).evaluate_grid(
+            x_range, y_range, mask=node_mask(cell_mask) if cell_mask is not None else None)
         
         print(f"KDE values range: {z.min()} to {z.max()}")
         
         # Use a more selective threshold - only top 10% of values
         threshold_percentile = 90  # Only keep top 10% of density values
-        threshold = np.percentile(z, threshold_percentile)
+        result_df, threshold = density_cells(z, x_range, y_range, threshold_percentile, cell_mask)
         
         print(f"Using threshold: {threshold} (top {100-threshold_percentile}% of values)")
         
-        # Create output data only for cells above threshold
-        output_data = []
-        
-        for i in range(len(x_range)-1):
-            for j in range(len(y_range)-1):
-                kde_value = z[j, i]  # Note: j, i order matches y, x
-                
-                # Only include cells above threshold
-                if kde_value > threshold:
-                    # Calculate cell center coordinates
-                    center_x = (x_range[i] + x_range[i+1]) / 2
-                    center_y = (y_range[j] + y_range[j+1]) / 2
-                    
-                    output_data.append({
-                        'x_projected': center_x,
-                        'y_projected': center_y,
-                        'kde_value': kde_value
-                    })
-        
-        if len(output_data) == 0:
+        if result_df is None:
             print("No significant density areas found above threshold")
             return False
         
-        print(f"Found {len(output_data)} significant density cells out of {len(x_range)*len(y_range)} total cells")
-        
-        # Create DataFrame with the filtered results
-        result_df = pd.DataFrame(output_data)
-        
-        # Create a more discriminating weight field using log transformation
-        # This will amplify differences between high and low density areas
-        min_val = result_df['kde_value'].min()
-        max_val = result_df['kde_value'].max()
-        
-        # Log transform to spread out the values more
-        result_df['kde_log'] = np.log10(result_df['kde_value'] + 1e-10)  # Add small value to avoid log(0)
-        
-        # Normalize the log values
-        log_min = result_df['kde_log'].min()
-        log_max = result_df['kde_log'].max()
-        result_df['kde_log_normalized'] = (result_df['kde_log'] - log_min) / (log_max - log_min)
-        
-        # Create an exponential weight that emphasizes high-density areas
-        result_df['kde_weight'] = np.power(result_df['kde_log_normalized'], 2) * 100  # Square for more contrast
-        
-        # Regular normalized version
-        result_df['kde_normalized'] = (result_df['kde_value'] - min_val) / (max_val - min_val)
-        
-        # Add percentile ranks within the filtered data
-        result_df['percentile'] = result_df['kde_value'].rank(pct=True) * 100
-        
-        # Create more distinct categories based on percentiles
-        conditions = [
-            (result_df['percentile'] >= 95),   # Top 5%
-            (result_df['percentile'] >= 80) & (result_df['percentile'] < 95),   # Next 15%
-            (result_df['percentile'] >= 60) & (result_df['percentile'] < 80),   # Next 20%
-            (result_df['percentile'] >= 40) & (result_df['percentile'] < 60),   # Next 20%
-            (result_df['percentile'] < 40)    # Bottom 40%
-        ]
-        categories = [
-            'Extreme High Density',
-            'Very High Density',
-            'High Density',
-            'Medium Density',
-            'Low Density'
-        ]
-        result_df['density_category'] = np.select(conditions, categories, default='Low Density')
-        
-        # Convert projected coordinates back to WGS84
-        print("Converting to WGS84 for Kepler.gl...")
-        
-        # Create points for coordinate transformation
-        projected_points = [Point(xy) for xy in zip(result_df['x_projected'], result_df['y_projected'])]
-        temp_gdf = gpd.GeoDataFrame(result_df, geometry=projected_points, crs="EPSG:32643")
-        
-        # Transform to WGS84
-        temp_gdf_wgs84 = temp_gdf.to_crs("EPSG:4326")
-        
-        # Extract lat/lng coordinates
-        result_df['longitude'] = temp_gdf_wgs84.geometry.x
-        result_df['latitude'] = temp_gdf_wgs84.geometry.y
+        print(f"Found {len(result_df)} significant density cells out of {len(x_range)*len(y_range)} total cells")
         
         # Create final output CSV with the new weight field
-        output_columns = ['latitude', 'longitude', 'kde_value', 'kde_normalized', 'kde_weight', 'percentile', 'density_category']
-        output_df = result_df[output_columns]
+        output_df = result_df[OUTPUT_COLUMNS]
         
         # Save results to the backend directory
         output_df.to_csv(output_path, index=False)
@@ -192,6 +315,19 @@ def perform_kde_analysis(start_date=None, end_date=None):
         print("\nFirst few rows of output:")
         print(output_df.head())
         
+        if isobands:
+            isoband_path = os.path.join(os.path.dirname(os.path.abspath(output_path)), 'kde_isobands.geojson')
+            with open(isoband_path, 'w') as f:
+                json.dump(density_isobands(result_df, x_range, y_range, isoband_simplify), f, separators=(',', ':'))
+            print(f"Isobands saved to {isoband_path} ({os.path.getsize(isoband_path)} bytes)")
+        
+        if tile_levels > 0:
+            # Zoom levels always use the binned engine: one binning serves every level
+            tile_kde = kde if kde_method == 'fft' else BinnedKDE(coords, weights=weights)
+            tile_dir = os.path.join(os.path.dirname(os.path.abspath(output_path)), 'kde_tiles')
+            write_tile_pyramid(tile_kde, (minx, miny, maxx, maxy), tile_dir, tile_min_cell, tile_levels,
+                               grid_mask=grid_mask)
+        
         # Verify file was created and has content
         if os.path.exists(output_path) and os.path.getsize(output_path) > 0:
             print("Output file created successfully")
@@ -206,12 +342,132 @@ def perform_kde_analysis(start_date=None, end_date=None):
         traceback.print_exc()
         return False
 
+def perform_category_kde_analysis(by, start_date=None, end_date=None, df=None, output_path=None,
+                                  cell_size=200, workers=1, clip='none', clip_buffer=1000):
+    """Density surfaces per category of `by` (a GROUP_BY_COLUMNS key) from one pass
+
+    All categories share the projected coordinates, the grid over the whole
+    study area and one batched FFT (see CategoryKDE), each with its own
+    bandwidth. Every surface is thresholded and weighted as in
+    perform_kde_analysis, and the cells are saved together in one CSV with
+    a `category` column, by default kde_analysis_results_by_<by>.csv.
+    """
+    try:
+        script_dir = os.path.dirname(os.path.abspath(__file__))
+        csv_path = os.path.join(script_dir, 'ps_removed_dt.csv')
+        output_path = output_path or os.path.join(script_dir, f'kde_analysis_results_by_{by}.csv')
+        category_column = GROUP_BY_COLUMNS[by]
+        print(f"Will save {by} surfaces to: {output_path}")
+        
+        df = load_incident_input(start_date, end_date, df, csv_path)
+        if df is None:
+            return False
+        df = df[df[category_column].notna()]
+        
+        x, y = to_projected(df['longitude'], df['latitude'])
+        minx, miny, maxx, maxy = x.min(), y.min(), x.max(), y.max()
+        x_range = np.arange(minx, maxx + cell_size, cell_size)
+        y_range = np.arange(miny, maxy + cell_size, cell_size)
+        grid_mask = GridMask.from_clip(clip, x, y, clip_buffer)
+        cell_mask = grid_mask.node_cells(x_range, y_range) if grid_mask is not None else None
+        
+        weights = df['ahp_weighted_event_types_nor_weight'].values if 'ahp_weighted_event_types_nor_weight' in df.columns else None
+        kde = CategoryKDE(np.vstack([x, y]), df[category_column].values, weights=weights, workers=workers)
+        if kde.skipped:
+            print(f"Skipping categories with too few incidents for a bandwidth: {', '.join(map(str, kde.skipped))}")
+        
+        z = kde.evaluate_grid(x_range, y_range)
+        print(f"Batched FFT KDE of {len(kde.labels)} {by} categories on {len(x_range)}x{len(y_range)} grid "
+              f"(max abs error vs exact: {kde.error_bound(x_range, y_range):.3e})")
+        
+        layers = []
+        for label, layer in zip(kde.labels, z):
+            cells, threshold = density_cells(layer, x_range, y_range, cell_mask=cell_mask)
+            if cells is None:
+                print(f"{label}: no significant density areas found above threshold")
+                continue
+            print(f"{label}: {len(cells)} cells above threshold {threshold}")
+            layers.append(cells[OUTPUT_COLUMNS].assign(category=label))
+        
+        if not layers:
+            print("No significant density areas found above threshold")
+            return False
+        
+        output_df = pd.concat(layers, ignore_index=True)[['category'] + OUTPUT_COLUMNS]
+        output_df.to_csv(output_path, index=False)
+        print(f"Category KDE analysis complete. {len(output_df)} cells saved to {output_path}")
+        return True
+        
+    except Exception as e:
+        print(f"Error in category KDE analysis: {str(e)}")
+        import traceback
+        traceback.print_exc()
+        return False
+
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(description='Perform KDE analysis')
     parser.add_argument('--start-date', type=str, help='Start date (YYYY-MM-DD)')
     parser.add_argument('--end-date', type=str, help='End date (YYYY-MM-DD)')
+    parser.add_argument('--kde-method', type=str, choices=['exact', 'fft', 'tree'], default='fft',
+                        help='fft: binned FFT convolution (fast, within the printed error bound); '
+                             'tree: truncated kernel over a KD-tree, within --kde-atol/--kde-rtol; '
+                             'exact: gaussian_kde at every grid node')
+    parser.add_argument('--cell-size', type=float, default=200,
+                        help='Grid cell size in meters (default: 200)')
+    parser.add_argument('--kde-cutoff', type=float, default=4.0,
+                        help='Tree method: kernel cutoff in bandwidths (default: 4)')
+    parser.add_argument('--kde-atol', type=float,
+                        help='Tree method: absolute density tolerance (default: the tail bound of the cutoff)')
+    parser.add_argument('--kde-rtol', type=float, default=1e-3,
+                        help='Tree method: relative density tolerance (default: 0.001)')
+    parser.add_argument('--tile-min-cell', type=float, default=50,
+                        help='Cell size in meters of the finest tile pyramid level (default: 50)')
+    parser.add_argument('--tile-levels', type=int, default=0,
+                        help='Tile pyramid levels for /api/kde/kde-tiles, each doubling the cell size, '
+                             'e.g. 6 for 50 m to 1.6 km; 0 disables (default: 0)')
+    parser.add_argument('--workers', type=int, default=1,
+                        help='Number of processes evaluating grid tiles (default: 1)')
+    parser.add_argument('--by', type=str, choices=list(GROUP_BY_COLUMNS),
+                        help='Build one surface per main type or severity label in a single pass '
+                             '(saved to kde_analysis_results_by_<by>.csv)')
+    parser.add_argument('--clip', type=str, choices=CLIP_MODES, default='none',
+                        help='Only evaluate and keep cells inside the city boundary, the buffered '
+                             'incident hull, or both (default: none)')
+    parser.add_argument('--clip-buffer', type=float, default=1000,
+                        help='Buffer around the incident hull in meters for --clip hull/both (default: 1000)')
+    parser.add_argument('--isobands', action='store_true',
+                        help='Also save the density categories as simplified polygons to kde_isobands.geojson')
+    parser.add_argument('--isoband-simplify', type=float,
+                        help='Isoband simplification tolerance in meters (default: half a cell)')
+    parser.add_argument('--max-memory-mb', type=float,
+                        help='Approximate memory ceiling for grid evaluation in MB (default: no limit)')
     
     args = parser.parse_args()
     
-    success = perform_kde_analysis(args.start_date, args.end_date)
+    if args.by:
+        success = perform_category_kde_analysis(
+            args.by, args.start_date, args.end_date,
+            cell_size=args.cell_size,
+            workers=args.workers,
+            clip=args.clip,
+            clip_buffer=args.clip_buffer
+        )
+        sys.exit(0 if success else 1)
+    
+    success = perform_kde_analysis(
+        args.start_date, args.end_date,
+        kde_method=args.kde_method,
+        cell_size=args.cell_size,
+        kde_cutoff=args.kde_cutoff,
+        kde_atol=args.kde_atol,
+        kde_rtol=args.kde_rtol,
+        tile_min_cell=args.tile_min_cell,
+        tile_levels=args.tile_levels,
+        workers=args.workers,
+        max_memory_mb=args.max_memory_mb,
+        clip=args.clip,
+        clip_buffer=args.clip_buffer,
+        isobands=args.isobands,
+        isoband_simplify=args.isoband_simplify
+    )
     sys.exit(0 if success else 1)
\ No newline at end of file
@@ -2,9 +2,15 @@ import pandas as pd
 import numpy as np
 import argparse
 import sys
+import os
 from processors.data_loader import DataLoader
 from processors.filter_processor import FilterProcessor
 from processors.spatial_processor import SpatialProcessor
+from processors.table_cache import TableCache
+from processors.time_index import sort_by_time
+from processors.incremental_store import IncrementalStore
+from processors.parallel_processor import ParallelProcessor, prepare_shard
+from functools import partial
 from utils.datetime_utils import parse_datetime_string, get_part_of_day
 
 def main():
@@ -14,45 +20,86 @@ def main():
         # Initialize processors
         data_loader = DataLoader()
         filter_processor = FilterProcessor()
-        spatial_processor = SpatialProcessor()
+        spatial_processor = SpatialProcessor(exclusion_radius=args.exclusion_radius)
+        table_cache = TableCache()
+        parallel_processor = ParallelProcessor(args.workers) if args.workers > 1 else None
+        incremental_store = None
+        bitmap_index = None
+        
+        if args.chunk_size:
+            if args.incremental:
+                raise ValueError("--chunk-size cannot be combined with --incremental")
+            stream_process(args, data_loader, filter_processor, spatial_processor, parallel_processor)
+            return
         
         # Load and prepare data
         if args.use_date_filtered_base:
             # Load from pre-filtered data (ps_removed_dt.csv)
-            import os
             if os.path.exists('ps_removed_dt.csv'):
-                processed_df = pd.read_csv('ps_removed_dt.csv')
+                processed_df = table_cache.load('ps_removed_dt.csv')
                 print("Loaded date-filtered base data from ps_removed_dt.csv")
+                # The base table is reused across filter requests, so its bitmap index is kept on disk
+                if filter_processor.has_filters(args):
+                    bitmap_index = filter_processor.build_bitmap_index(processed_df, table_cache, 'ps_removed_dt.csv')
             else:
                 raise FileNotFoundError("ps_removed_dt.csv not found. Date filtering must be performed first.")
+        elif args.incremental:
+            # Only rows appended to input_data.csv since the last run are prepared
+            incremental_store = IncrementalStore()
+            csv2, city_geometries = data_loader.load_reference_data()
+            new_rows = ingest_new_rows(incremental_store, data_loader, spatial_processor, parallel_processor,
+                                       csv2, city_geometries)
+            appended_df = spatial_processor.remove_near_police_stations(new_rows, csv2) if len(new_rows) else new_rows
+            csv1 = incremental_store.load()
+            
+            if args.start_date and args.end_date:
+                csv1 = filter_processor.apply_datetime_filter(csv1, args.start_date, args.end_date)
+            
+            report_radius_sensitivity(spatial_processor, csv1, args.radius_sensitivity)
+            processed_df = spatial_processor.remove_near_police_stations(csv1, csv2)
         else:
-            # Load original data and prepare
-            csv1, csv2, city_geometries = data_loader.load_all_data()
-            csv1 = data_loader.prepare_data(csv1, city_geometries)
+            # Load original data and prepare (cached while input_data.csv is unchanged)
+            csv1, csv2, city_geometries = data_loader.load_prepared_data(table_cache, spatial_processor, parallel_processor)
             
             # Apply datetime filtering if provided
             if args.start_date and args.end_date:
-                csv1 = filter_processor.apply_datetime_filter(csv1, args.start_date, args.end_date)
+                csv1 = filter_processor.apply_datetime_filter(csv1, args.start_date, args.end_date,
+                                                              data_loader.time_index)
             
             # Apply spatial filtering (remove points near police stations)
+            report_radius_sensitivity(spatial_processor, csv1, args.radius_sensitivity)
             processed_df = spatial_processor.remove_near_police_stations(csv1, csv2)
         
         # Apply additional filters if needed
         has_other_filters = filter_processor.has_filters(args)
         if has_other_filters:
-            processed_df = filter_processor.apply_all_filters(processed_df, args)
+            processed_df = filter_processor.apply_all_filters(processed_df, args, bitmap_index)
             output_file = 'filtered_data.csv'
         else:
             output_file = 'ps_removed_dt.csv'
             # Remove filtered_data.csv if it exists when only date filtering is applied
-            import os
             if os.path.exists('filtered_data.csv'):
                 os.remove('filtered_data.csv')
                 print("Removed existing filtered_data.csv (date-only filtering)")
         
         # Save result
-        processed_df.to_csv(output_file, index=False, encoding='utf-8')
-        print(f"Data saved to {output_file}")
+        is_full_store = (incremental_store is not None and not has_other_filters
+                         and not (args.start_date and args.end_date))
+        output_settings = {'exclusion_radius': spatial_processor.exclusion_radius}
+        if is_full_store and incremental_store.can_append_output(output_file, output_settings):
+            # The output already holds every earlier row, so only the new ones are written
+            appended_df.to_csv(output_file, mode='a', header=False, index=False, encoding='utf-8')
+            print(f"Appended {len(appended_df)} new rows to {output_file}")
+        else:
+            processed_df.to_csv(output_file, index=False, encoding='utf-8')
+            print(f"Data saved to {output_file}")
+        
+        # Cache the typed table so the analysis scripts can skip parsing the CSV
+        table_cache.store(output_file, processed_df)
+        
+        if incremental_store is not None:
+            incremental_store.record_output(output_file, is_full_store, output_settings)
+            incremental_store.save_state()
         
     except Exception as e:
         print(f"Error: {str(e)}", file=sys.stderr)
@@ -72,7 +119,93 @@ def parse_arguments():
                        help='Apply combined filtering')
     parser.add_argument('--use-date-filtered-base', action='store_true',
                        help='Use ps_removed_dt.csv as base data instead of original data')
+    parser.add_argument('--incremental', action='store_true',
+                       help='Only process rows appended to input_data.csv since the last incremental run')
+    parser.add_argument('--exclusion-radius', type=float, default=250,
+                       help='Drop incidents within this many meters of a police station (default: 250)')
+    parser.add_argument('--radius-sensitivity', type=str,
+                       help='Comma-separated exclusion radii in meters to report kept-incident counts for')
+    parser.add_argument('--chunk-size', type=int,
+                       help='Stream the input in chunks of this many rows. Peak memory is then bounded by '
+                            'the chunk size (roughly 1 KB per row in flight plus the police stations and '
+                            'city boundary) instead of growing with the input file')
+    parser.add_argument('--workers', type=int, default=1,
+                       help='Number of processes for date parsing, city classification and police-distance '
+                            'queries; rows are sharded and merged back in their original order')
     return parser.parse_args()
 
+def ingest_new_rows(incremental_store, data_loader, spatial_processor, parallel_processor, police_df, city_geometries):
+    """Prepare the new crime rows, add nearest-station distances and add them to the store"""
+    new_rows = incremental_store.read_new_rows(data_loader.input_files['crime_data'])
+    if len(new_rows) == 0:
+        return new_rows
+    
+    if parallel_processor is not None:
+        new_rows = parallel_processor.prepare(new_rows, data_loader, spatial_processor, police_df, city_geometries)
+    else:
+        new_rows = prepare_shard(new_rows, data_loader, spatial_processor, police_df, city_geometries)
+    # Feeds are mostly chronological, so sorted batches keep the store close to time order
+    new_rows = sort_by_time(new_rows)
+    incremental_store.append(new_rows)
+    return new_rows
+
+def stream_process(args, data_loader, filter_processor, spatial_processor, parallel_processor=None):
+    """Run the loader, filter and spatial stages one chunk at a time, appending to the output file
+
+    Only one chunk of rows is held in memory at any point (two per worker
+    with --workers), so peak memory depends on --chunk-size rather than on
+    the size of the input.
+    """
+    police_df, city_geometries = data_loader.load_reference_data()
+    has_other_filters = filter_processor.has_filters(args)
+    output_file = 'filtered_data.csv' if has_other_filters else 'ps_removed_dt.csv'
+    
+    if args.use_date_filtered_base:
+        if not os.path.exists('ps_removed_dt.csv'):
+            raise FileNotFoundError("ps_removed_dt.csv not found. Date filtering must be performed first.")
+        source_file = 'ps_removed_dt.csv'
+    else:
+        source_file = data_loader.input_files['crime_data']
+    
+    # Write to a temporary file so the source and a half-written output never collide
+    temp_file = output_file + '.tmp'
+    chunks = pd.read_csv(source_file, chunksize=args.chunk_size)
+    if not args.use_date_filtered_base:
+        prepare = partial(prepare_shard, data_loader=data_loader, spatial_processor=spatial_processor,
+                          police_df=police_df, city_geometries=city_geometries)
+        chunks = parallel_processor.map_ordered(prepare, chunks) if parallel_processor else map(prepare, chunks)
+    
+    rows_out = 0
+    for chunk_number, chunk in enumerate(chunks):
+        if not args.use_date_filtered_base:
+            if args.start_date and args.end_date:
+                chunk = filter_processor.apply_datetime_filter(chunk, args.start_date, args.end_date)
+            chunk = spatial_processor.remove_near_police_stations(chunk, police_df)
+        
+        if has_other_filters:
+            chunk = filter_processor.apply_all_filters(chunk, args)
+        
+        chunk.to_csv(temp_file, mode='w' if chunk_number == 0 else 'a', header=chunk_number == 0,
+                     index=False, encoding='utf-8')
+        rows_out += len(chunk)
+        print(f"Chunk {chunk_number + 1}: {rows_out} rows written")
+    
+    os.replace(temp_file, output_file)
+    if not has_other_filters and os.path.exists('filtered_data.csv'):
+        os.remove('filtered_data.csv')
+        print("Removed existing filtered_data.csv (date-only filtering)")
+    print(f"Data saved to {output_file}")
+
+def report_radius_sensitivity(spatial_processor, crime_df, radii_arg):
+    """Print how many incidents each candidate exclusion radius would keep"""
+    if not radii_arg or 'nearest_ps_distance' not in crime_df.columns:
+        return
+    
+    radii = [float(r) for r in radii_arg.split(',')]
+    masks = spatial_processor.exclusion_masks(crime_df, radii)
+    print("Exclusion radius sensitivity:")
+    for radius, mask in masks.items():
+        print(f"  {radius:g} m: {int(mask.sum())} of {len(crime_df)} incidents kept")
+
 if __name__ == "__main__":
     main()
\ No newline at end of file
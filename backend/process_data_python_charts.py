@@ -5,6 +5,8 @@ import sys
 import os
 import logging
 from dateutil.relativedelta import relativedelta 
+from processors.table_cache import TableCache
+from processors.time_index import TimeIndex
 
 # Configure logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
@@ -41,34 +43,8 @@ def load_and_preprocess_data():
     
     try:
         logging.info(f"Loading data from: {filepath}")
-        df = pd.read_csv(filepath, low_memory=False)
-
-        df[CONFIG["DATE_COLUMN"]] = pd.to_datetime(df[CONFIG["DATE_COLUMN"]], errors='coerce')
-        df.dropna(subset=[CONFIG["DATE_COLUMN"]], inplace=True)
-
-        df['event_year'] = df[CONFIG["DATE_COLUMN"]].dt.year
-        df['event_month'] = df[CONFIG["DATE_COLUMN"]].dt.month
-        df['event_day'] = df[CONFIG["DATE_COLUMN"]].dt.day
-        df['event_hour'] = df[CONFIG["DATE_COLUMN"]].dt.hour
-        df['event_day_of_week'] = df[CONFIG["DATE_COLUMN"]].dt.day_name()
-
-        def get_part_of_day(hour):
-            if 5 <= hour < 12: return 'Morning'
-            elif 12 <= hour < 17: return 'Afternoon'
-            elif 17 <= hour < 21: return 'Evening'
-            else: return 'Night'
-
-        df['event_part_of_day'] = df['event_hour'].apply(get_part_of_day).astype('category')
-
-        for col in [CONFIG["MAIN_EVENT_TYPE_COL"], CONFIG["SUB_EVENT_TYPE_COL"], CONFIG["EVENT_LABEL_COL"], 'event_day_of_week', 'event_part_of_day']:
-            if col in df.columns:
-                df[col] = df[col].astype('category')
-
-        if CONFIG["EVENT_LABEL_COL"] in df.columns:
-            desired_order = ['EMERGENCY', 'HIGH', 'MEDIUM', 'LOW']
-            filtered_desired_order = [label for label in desired_order if label in df[CONFIG["EVENT_LABEL_COL"]].unique()]
-            if filtered_desired_order:
-                df[CONFIG["EVENT_LABEL_COL"]] = pd.Categorical(df[CONFIG["EVENT_LABEL_COL"]], categories=filtered_desired_order, ordered=True)
+        # The preprocessed table is cached by file content, so repeated chart requests skip the CSV parse
+        df = TableCache(log=logging.info).load(filepath, prepare=preprocess_data, tag='charts')
 
         logging.info(f"Data loaded and preprocessed successfully from {os.path.basename(filepath)}. Shape: {df.shape}")
         return df
@@ -79,19 +55,62 @@ def load_and_preprocess_data():
         logging.error(f"An error occurred during initial data loading/preprocessing: {e}", exc_info=True)
         return pd.DataFrame()
 
+def preprocess_data(df):
+    """Derive the date parts and categorical columns used by the chart actions"""
+    df[CONFIG["DATE_COLUMN"]] = pd.to_datetime(df[CONFIG["DATE_COLUMN"]], errors='coerce')
+    df.dropna(subset=[CONFIG["DATE_COLUMN"]], inplace=True)
+
+    df['event_year'] = df[CONFIG["DATE_COLUMN"]].dt.year
+    df['event_month'] = df[CONFIG["DATE_COLUMN"]].dt.month
+    df['event_day'] = df[CONFIG["DATE_COLUMN"]].dt.day
+    df['event_hour'] = df[CONFIG["DATE_COLUMN"]].dt.hour
+    df['event_day_of_week'] = df[CONFIG["DATE_COLUMN"]].dt.day_name()
+
+    def get_part_of_day(hour):
+        if 5 <= hour < 12: return 'Morning'
+        elif 12 <= hour < 17: return 'Afternoon'
+        elif 17 <= hour < 21: return 'Evening'
+        else: return 'Night'
+
+    df['event_part_of_day'] = df['event_hour'].apply(get_part_of_day).astype('category')
+
+    for col in [CONFIG["MAIN_EVENT_TYPE_COL"], CONFIG["SUB_EVENT_TYPE_COL"], CONFIG["EVENT_LABEL_COL"], 'event_day_of_week', 'event_part_of_day']:
+        if col in df.columns:
+            df[col] = df[col].astype('category')
+
+    if CONFIG["EVENT_LABEL_COL"] in df.columns:
+        desired_order = ['EMERGENCY', 'HIGH', 'MEDIUM', 'LOW']
+        filtered_desired_order = [label for label in desired_order if label in df[CONFIG["EVENT_LABEL_COL"]].unique()]
+        if filtered_desired_order:
+            df[CONFIG["EVENT_LABEL_COL"]] = pd.Categorical(df[CONFIG["EVENT_LABEL_COL"]], categories=filtered_desired_order, ordered=True)
+
+    return df
+
 # Load data once when the script starts (efficient for single run)
 df_cached = load_and_preprocess_data()
+time_index_cached = None
+
+def get_time_index(df):
+    """Time index for df, built once for the cached table (trend baselines query it repeatedly)"""
+    global time_index_cached
+    if df is not df_cached:
+        return TimeIndex.from_frame(df, CONFIG["DATE_COLUMN"])
+    if time_index_cached is None:
+        time_index_cached = TimeIndex.from_frame(df_cached, CONFIG["DATE_COLUMN"])
+    return time_index_cached
 
 def get_filtered_data(df, filters):
-    df_filtered = df.copy()
+    # Filters only select rows; nothing below modifies them, so no copy is taken
+    df_filtered = df
 
-    # Apply Date Range
+    # Apply Date Range (binary search on the time index; a slice when the data is time-sorted)
+    start_dt = end_dt = None
     if filters.get('start_date'):
         start_dt = datetime.strptime(filters['start_date'], '%Y-%m-%d')
-        df_filtered = df_filtered[df_filtered[CONFIG["DATE_COLUMN"]] >= start_dt]
     if filters.get('end_date'):
         end_dt = datetime.strptime(filters['end_date'], '%Y-%m-%d').replace(hour=23, minute=59, second=59)
-        df_filtered = df_filtered[df_filtered[CONFIG["DATE_COLUMN"]] <= end_dt]
+    if start_dt or end_dt:
+        df_filtered = get_time_index(df).select(df, start_dt, end_dt)
 
     # Apply Part of Day Filter
     if filters.get('part_of_day') and 'event_part_of_day' in df_filtered.columns:
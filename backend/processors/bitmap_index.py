@@ -0,0 +1,100 @@
+import pandas as pd
+import numpy as np
+import hashlib
+import json
+import os
+
+# Rows hashed to check that a persisted index still lines up with a table's rows
+FINGERPRINT_ROWS = 4096
+
+class BitmapIndex:
+    """One packed bitset per distinct value of each indexed column"""
+
+    def __init__(self, n_rows, bitmaps, fingerprint=None):
+        self.n_rows = n_rows
+        self.bitmaps = bitmaps
+        self.fingerprint = fingerprint
+
+    @classmethod
+    def from_frame(cls, df, columns):
+        """Build bitsets for every distinct value of the given columns"""
+        bitmaps = {}
+        for column in columns:
+            if column not in df.columns:
+                continue
+            # Missing values get code -1 and so never match, as with isin
+            codes, uniques = pd.factorize(df[column])
+            bitmaps[column] = {
+                value: np.packbits(codes == code)
+                for code, value in enumerate(uniques.tolist())
+            }
+        return cls(len(df), bitmaps, row_fingerprint(df, bitmaps.keys()))
+
+    @classmethod
+    def for_table(cls, table_cache, source_path, df, columns):
+        """Load the persisted index for a cached table, building and saving it on a miss"""
+        index_path = table_cache.artifact_path(source_path, 'bitmap', 'npz')
+        if os.path.exists(index_path):
+            try:
+                index = cls.load(index_path)
+                indexed = [c for c in columns if c in df.columns]
+                if (index.n_rows == len(df) and set(index.bitmaps) == set(indexed)
+                        and index.fingerprint == row_fingerprint(df, index.bitmaps.keys())):
+                    return index
+            except Exception as e:
+                print(f"Ignoring unreadable bitmap index {index_path}: {e}")
+
+        index = cls.from_frame(df, columns)
+        table_cache.write_artifact(index_path, index.save)
+        return index
+
+    def mask(self, selections):
+        """Boolean row mask for {column: allowed values}: OR within a column, AND across columns
+
+        Columns that are not indexed are ignored. Returns None when nothing
+        was selected, so callers can skip materializing rows altogether.
+        """
+        combined = None
+        for column, values in selections.items():
+            if column not in self.bitmaps:
+                continue
+            column_bits = np.zeros((self.n_rows + 7) // 8, dtype=np.uint8)
+            for value in values:
+                bits = self.bitmaps[column].get(value)
+                if bits is not None:
+                    column_bits |= bits
+            combined = column_bits if combined is None else combined & column_bits
+
+        if combined is None:
+            return None
+        return np.unpackbits(combined, count=self.n_rows).astype(bool)
+
+    def save(self, path):
+        """Save the bitsets as one npz archive"""
+        arrays, keys = {}, []
+        for column, values in self.bitmaps.items():
+            for value, bits in values.items():
+                arrays[f"b{len(keys)}"] = bits
+                keys.append([column, value])
+        # Values keep their type (e.g. booleans for inside_trvcity) as JSON, so loading needs no pickle
+        np.savez(path, n_rows=self.n_rows, keys=np.array(json.dumps(keys)),
+                 fingerprint=np.array(self.fingerprint or ''), **arrays)
+
+    @classmethod
+    def load(cls, path):
+        """Load bitsets written by save"""
+        with np.load(path) as archive:
+            bitmaps = {}
+            for i, (column, value) in enumerate(json.loads(str(archive['keys']))):
+                bitmaps.setdefault(column, {})[value] = archive[f"b{i}"]
+            fingerprint = str(archive['fingerprint']) if 'fingerprint' in archive.files else None
+            return cls(int(archive['n_rows']), bitmaps, fingerprint or None)
+
+def row_fingerprint(df, columns):
+    """Hash of the indexed columns on evenly spaced rows, so a reordered or different table is caught"""
+    columns = list(columns)
+    if not columns or len(df) == 0:
+        return None
+    rows = np.unique(np.linspace(0, len(df) - 1, min(len(df), FINGERPRINT_ROWS)).astype(np.int64))
+    hashes = pd.util.hash_pandas_object(df[columns].iloc[rows], index=False).to_numpy()
+    return hashlib.blake2b(hashes.tobytes(), digest_size=16).hexdigest()
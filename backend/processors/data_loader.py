@@ -1,7 +1,13 @@
 import pandas as pd
+import numpy as np
 import json
-from shapely.geometry import Point, shape
-from utils.datetime_utils import parse_datetime_string, get_part_of_day
+import os
+import shapely
+from shapely.geometry import shape
+from shapely.strtree import STRtree
+from utils.datetime_utils import parse_datetime_column, get_part_of_day
+from processors.table_cache import TableCache
+from processors.time_index import TimeIndex, sort_by_time
 
 class DataLoader:
     def __init__(self):
@@ -10,6 +16,8 @@ class DataLoader:
             'police_stations': 'police_station.csv',
             'city_boundary': './data/trv_city.geojson'
         }
+        # Time index of the table load_prepared_data last returned
+        self.time_index = None
     
     def load_all_data(self):
         """Load all required data files"""
@@ -18,18 +26,53 @@ class DataLoader:
         city_geometries = self._load_city_boundary()
         return csv1, csv2, city_geometries
     
+    def load_prepared_data(self, cache=None, spatial_processor=None, parallel_processor=None):
+        """Load prepared crime data, reusing the cached table while the inputs are unchanged
+
+        The table is stored in time order, so its time index (kept in
+        self.time_index) is built here once, without re-checking the order.
+        """
+        cache = cache or TableCache()
+        csv2, city_geometries = self.load_reference_data()
+        
+        def prepare(df):
+            if parallel_processor is not None and spatial_processor is not None:
+                df = parallel_processor.prepare(df, self, spatial_processor, csv2, city_geometries)
+            else:
+                df = self.prepare_data(df, city_geometries)
+                # Nearest-station distances are stored once so any exclusion radius is a comparison
+                if spatial_processor is not None:
+                    df = spatial_processor.add_police_distance(df, csv2)
+            # Kept in time order so date ranges resolve to slices by binary search
+            return sort_by_time(df)
+        
+        reference_files = [self.input_files['city_boundary'], self.input_files['police_stations']]
+        csv1 = cache.load(
+            self.input_files['crime_data'],
+            prepare=prepare,
+            tag='prepared' if spatial_processor is None else 'prepared_ps',
+            depends_on=[path for path in reference_files if os.path.exists(path)]
+        )
+        self.time_index = TimeIndex.from_frame(csv1, 'signal_lan', assume_sorted=True) if 'signal_lan' in csv1.columns else None
+        return csv1, csv2, city_geometries
+    
+    def load_reference_data(self):
+        """Load the police stations and city boundary used to prepare crime data"""
+        csv2 = pd.read_csv(self.input_files['police_stations'])
+        city_geometries = self._load_city_boundary()
+        return csv2, city_geometries
+    
     def prepare_data(self, df, city_geometries):
         """Prepare data by adding computed columns"""
         # Process datetime and add part_of_day
         if 'signal_lan' in df.columns:
-            df['signal_lan'] = df['signal_lan'].apply(parse_datetime_string)
+            df['signal_lan'], _ = parse_datetime_column(df['signal_lan'])
             df = df.dropna(subset=['signal_lan'])
             df['part_of_day'] = df['signal_lan'].dt.hour.apply(get_part_of_day)
         
         # Add inside_city column
-        df['inside_trvcity'] = df.apply(
-            lambda row: self._point_in_city(row['latitude'], row['longitude'], city_geometries), 
-            axis=1
+        df['inside_trvcity'] = self._points_in_city(
+            df['latitude'].values, df['longitude'].values, city_geometries
         ) if city_geometries else False
         
         return df
@@ -43,7 +86,17 @@ class DataLoader:
         except Exception:
             return []
     
-    def _point_in_city(self, lat, lon, city_geometries):
-        """Check if point is inside city boundaries"""
-        point = Point(lon, lat)
-        return any(geom.contains(point) for geom in city_geometries)
\ No newline at end of file
+    def _points_in_city(self, lat, lon, city_geometries):
+        """Check which points fall inside any city boundary (vectorized)"""
+        points = shapely.points(np.asarray(lon, dtype=float), np.asarray(lat, dtype=float))
+        for geom in city_geometries:
+            shapely.prepare(geom)
+        
+        # The tree prunes candidates by bounding box; the exact test runs on
+        # prepared geometries for the remaining (point, boundary) pairs only
+        tree = STRtree(city_geometries)
+        point_idx, _ = tree.query(points, predicate='within')
+        
+        inside = np.zeros(len(points), dtype=bool)
+        inside[point_idx] = True
+        return inside
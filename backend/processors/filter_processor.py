@@ -1,5 +1,7 @@
 import pandas as pd
 from utils.datetime_utils import parse_datetime_string
+from processors.bitmap_index import BitmapIndex
+from processors.time_index import TimeIndex
 
 class FilterProcessor:
     def __init__(self):
@@ -18,54 +20,78 @@ class FilterProcessor:
             args.part_of_day, args.city_location != 'all'
         ])
     
-    def apply_datetime_filter(self, df, start_date, end_date):
-        """Apply datetime filtering"""
+    def apply_datetime_filter(self, df, start_date, end_date, time_index=None):
+        """Apply datetime filtering
+        
+        Resolved by binary search on a time index: the one given (e.g.
+        DataLoader.time_index for the prepared table), else one built here,
+        which needs no parse or sort when signal_lan is already a
+        time-ordered datetime column. On time-sorted data the result is a
+        slice of df rather than a copy.
+        """
         start_datetime = parse_datetime_string(start_date)
         end_datetime = parse_datetime_string(end_date)
         
         if start_datetime and end_datetime:
-            mask = (df['signal_lan'] >= start_datetime) & (df['signal_lan'] <= end_datetime)
-            return df[mask]
+            time_index = time_index or TimeIndex.from_frame(df, 'signal_lan')
+            return time_index.select(df, start_datetime, end_datetime)
         return df
     
-    def apply_all_filters(self, df, args):
+    def apply_all_filters(self, df, args, bitmap_index=None):
         """Apply all specified filters"""
-        filtered_df = df.copy()
-        
         # Parse filter arguments
+        return self.apply_filters(
+            df,
+            main_types=self._parse_csv_arg(args.main_types),
+            subtypes=self._parse_csv_arg(args.subtypes),
+            severities=self._parse_csv_arg(args.severities),
+            part_of_day=self._parse_csv_arg(args.part_of_day),
+            city_location=args.city_location,
+            bitmap_index=bitmap_index
+        )
+    
+    def apply_filters(self, df, main_types=None, subtypes=None, severities=None, part_of_day=None,
+                      city_location='all', bitmap_index=None):
+        """Apply filters given as lists of allowed values
+        
+        The filters are combined into one row mask and rows are selected
+        once at the end. A prebuilt bitmap index (e.g. the persisted one of
+        a cached table) resolves them as bitwise OR/AND; without one, isin
+        per column is cheaper than building an index for a single use.
+        """
         filters = {
-            'main_types': self._parse_csv_arg(args.main_types),
-            'subtypes': self._parse_csv_arg(args.subtypes),
-            'severities': self._parse_csv_arg(args.severities),
-            'part_of_day': self._parse_csv_arg(args.part_of_day)
+            'main_types': main_types,
+            'subtypes': subtypes,
+            'severities': severities,
+            'part_of_day': part_of_day
+        }
+        selections = {
+            self.filter_columns[filter_name]: values
+            for filter_name, values in filters.items() if values
         }
         
-        # Apply each filter
-        for filter_name, values in filters.items():
-            if values:
-                filtered_df = self._apply_filter(filtered_df, filter_name, values)
-        
-        # Apply city location filter
-        if args.city_location != 'all':
-            filtered_df = self._apply_city_location_filter(filtered_df, args.city_location)
+        # City location filter
+        if city_location in ('inside', 'outside'):
+            selections[self.filter_columns['city_location']] = [city_location == 'inside']
         
-        return filtered_df
+        mask = bitmap_index.mask(selections) if bitmap_index is not None else self._isin_mask(df, selections)
+        return df if mask is None else df[mask]
     
-    def _apply_filter(self, df, filter_name, values):
-        """Apply a specific filter"""
-        column = self.filter_columns[filter_name]
-        if column in df.columns:
-            return df[df[column].isin(values)]
-        return df
+    def _isin_mask(self, df, selections):
+        """Row mask for {column: allowed values} from isin, None when no selected column is present"""
+        mask = None
+        for column, values in selections.items():
+            if column in df.columns:
+                column_mask = df[column].isin(values).to_numpy()
+                mask = column_mask if mask is None else mask & column_mask
+        return mask
     
-    def _apply_city_location_filter(self, df, location):
-        """Apply city location filter"""
-        if 'inside_trvcity' in df.columns:
-            if location == 'inside':
-                return df[df['inside_trvcity'] == True]
-            elif location == 'outside':
-                return df[df['inside_trvcity'] == False]
-        return df
+    def build_bitmap_index(self, df, table_cache=None, source_path=None):
+        """Bitmap index over every filter column, persisted next to the cached table when given"""
+        columns = list(self.filter_columns.values())
+        if table_cache is not None and source_path is not None:
+            return BitmapIndex.for_table(table_cache, source_path, df, columns)
+        return BitmapIndex.from_frame(df, columns)
     
     def _parse_csv_arg(self, arg):
         """Parse comma-separated argument"""
@@ -0,0 +1,229 @@
+import numpy as np
+from scipy import sparse
+from scipy.spatial import cKDTree
+from scipy.stats import norm
+from processors.parallel_processor import ParallelProcessor
+
+# p-value cut-offs of the hotspot classifications, which early stopping decides cells against
+SIGNIFICANCE_LEVELS = (0.01, 0.05, 0.1)
+# Two-sided 99.9% normal quantile for the early stopping confidence intervals
+EARLY_STOP_Z = 3.29
+# Permutations drawn per seed (the unit of reproducible randomness) and between early stopping checks
+PERMUTATION_CHUNK = 100
+
+def distance_band_weights(coords, threshold, binary=True, alpha=-1.0):
+    """Sparse distance-band weights like libpysal's DistanceBand
+
+    Pairs of points at most threshold apart are neighbours (a point is not
+    its own neighbour), weighted 1 if binary, else distance ** alpha.
+    Returns an n x n CSR matrix.
+    """
+    tree = cKDTree(np.asarray(coords, dtype=float))
+    distances = tree.sparse_distance_matrix(tree, threshold, output_type='coo_matrix').tocsr()
+    # Zero distances (the point itself) are not stored
+    distances.eliminate_zeros()
+    distances.data = np.ones_like(distances.data) if binary else distances.data ** alpha
+    return distances
+
+class LocalG:
+    """Getis-Ord local G (or G* with star=True) for every cell from sparse matrix products
+
+    Mirrors esda.getisord.G_Local: the weights (a scipy sparse matrix or a
+    libpysal W) are binary ('B') or row-standardized ('R'), and z-scores
+    use G_Local's analytic mean and variance, so Gs, EGs, VGs and Zs
+    match it. p_norm is the one-sided normal p-value of |Zs|, as in
+    G_Local. Conditional permutation inference is opt-in: with
+    permutations > 0, p_sim holds the folded pseudo p-values, run on
+    `workers` processes or on the pool of a parallel_processor the caller
+    keeps open across calls (see permutation_p_values).
+
+    y may also be an (n, k) matrix of k variables on the same cells (e.g.
+    one column per crime category): every statistic then comes out as an
+    (n, k) array, from one sparse product with the shared weights.
+    """
+
+    def __init__(self, y, weights, transform='R', star=False, permutations=0, seed=None, workers=1,
+                 early_stop=True, parallel_processor=None):
+        self.y = np.asarray(y, dtype=float)
+        if self.y.ndim != 2:
+            self.y = self.y.flatten()
+        self.n = len(self.y)
+        self.star = star
+        self.w = self._structure(weights, transform, star)
+        self.permutations = permutations
+        self.calc()
+        self.p_norm = norm.sf(np.abs(self.Zs))
+        self.permutations_run = None
+        self.p_sim = self.permutation_p_values(
+            permutations, seed, workers, early_stop, parallel_processor
+        ) if permutations else None
+
+    def _structure(self, weights, transform, star):
+        """CSR weights with the diagonal G (zero) or G* (self weight) needs, then transformed"""
+        if transform.lower() not in ('r', 'b'):
+            raise ValueError(f'Transforms must be binary "B" or row-standardized "R", got {transform}')
+        # Copied, as the weights may be shared (e.g. from the lattice weights cache)
+        w = sparse.csr_matrix(weights.sparse if hasattr(weights, 'sparse') else weights, dtype=float, copy=True)
+        if transform.lower() == 'b':
+            w.data = np.ones_like(w.data)
+
+        if star:
+            # Self weight: 1 for binary weights, else the row's largest weight (as G_Local assumes)
+            self_weight = 1.0 if transform.lower() == 'b' else w.max(axis=1).toarray().ravel()
+            w = w.tolil()
+            w.setdiag(self_weight)
+            w = w.tocsr()
+        else:
+            w.setdiag(0)
+        w.eliminate_zeros()
+
+        if transform.lower() == 'r':
+            row_sums = np.asarray(w.sum(axis=1)).ravel()
+            # Islands (no neighbours) keep an empty row
+            scale = np.divide(1.0, row_sums, out=np.zeros_like(row_sums), where=row_sums != 0)
+            w = sparse.diags(scale) @ w
+        return w.tocsr()
+
+    def calc(self):
+        y = self.y
+        remove_self = not self.star
+        N = self.n - remove_self
+        self.y_sum = y.sum(axis=0)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            self.Gs = (self.w @ y) / (self.y_sum - y * remove_self)
+
+            # Moments for analytic inference, with the focal cell left out for G
+            empirical_mean = (self.y_sum - y * remove_self) / N
+            mean_of_squares = ((y**2).sum(axis=0) - (y**2) * remove_self) / N
+            empirical_variance = mean_of_squares - empirical_mean**2
+
+            cardinality = np.asarray(self.w.sum(axis=1)).ravel()
+            if y.ndim == 2:
+                cardinality = cardinality[:, None]
+            self.EGs = cardinality / N
+            self.VGs = cardinality * (N - cardinality) / (N - 1) / N**2 * (empirical_variance / empirical_mean**2)
+            self.Zs = (self.Gs - self.EGs) / np.sqrt(self.VGs)
+
+    def permutation_p_values(self, permutations, seed=None, workers=1, early_stop=True, parallel_processor=None):
+        """Folded pseudo p-values from conditional randomization
+
+        For each cell its neighbours' weights are applied to values drawn
+        at random (without replacement) from all other cells, with one set
+        of draws shared by every cell as in esda. Draws come in chunks of
+        PERMUTATION_CHUNK, each from its own child of SeedSequence(seed),
+        and cells are split into one block per worker, each drawing the
+        chunks it needs itself, so a seeded run gives the same p-values for
+        any worker count. The blocks run on parallel_processor's pool if
+        given (e.g. one kept open for every time window of a run), else on
+        a pool of `workers` processes started for this call. With early_stop, a
+        cell stops drawing once the confidence interval of its p-value
+        excludes every SIGNIFICANCE_LEVELS cut-off; permutations_run holds
+        the permutations each cell used. Every column of a matrix y is
+        tested against the same draws.
+        """
+        w = self.w
+        cells = np.arange(self.n)
+        counts = np.diff(w.indptr)
+        rows = np.repeat(cells, counts)
+        own = w.indices == rows
+        self_weight = np.bincount(rows[own], weights=w.data[own], minlength=self.n)
+
+        # Neighbour weights other than the cell itself, left-aligned in a padded (n, k) array
+        rows, weights = rows[~own], w.data[~own]
+        slots = np.arange(len(rows)) - np.searchsorted(rows, rows)
+        max_neighbors = int(slots.max()) + 1 if len(slots) else 0
+        padded = np.zeros((self.n, max_neighbors))
+        padded[rows, slots] = weights
+
+        seeds = np.random.SeedSequence(seed).spawn(-(-permutations // PERMUTATION_CHUNK))
+        if parallel_processor is not None:
+            workers = parallel_processor.workers
+        # Every block draws the same permutations, so there is one block per worker
+        blocks = [block for block in np.array_split(cells, workers) if len(block)] if workers > 1 else [cells]
+        columns = self.y.T if self.y.ndim == 2 else self.y[None]
+        observed = self.Gs.T if self.y.ndim == 2 else self.Gs[None]
+        tasks = []
+        for y, y_sum, column_g in zip(columns, np.atleast_1d(self.y_sum), observed):
+            if self.star:
+                offset = self_weight * y
+                denominator = np.full(self.n, y_sum)
+            else:
+                offset = np.zeros(self.n)
+                denominator = y_sum - y
+            tasks.extend(
+                (y, padded[block], block, offset[block], denominator[block], column_g[block],
+                 seeds, permutations, max_neighbors, early_stop)
+                for block in blocks
+            )
+        if workers > 1 and len(tasks) > 1:
+            results = list((parallel_processor or ParallelProcessor(workers)).map_ordered(permutation_block, tasks))
+        else:
+            results = [permutation_block(task) for task in tasks]
+
+        larger = np.concatenate([block_larger for block_larger, _ in results]).reshape(len(columns), self.n)
+        permutations_run = np.concatenate([block_run for _, block_run in results]).reshape(len(columns), self.n)
+        folded = np.minimum(larger, permutations_run - larger)
+        p_sim = (folded + 1) / (permutations_run + 1)
+        if self.y.ndim != 2:
+            permutations_run, p_sim = permutations_run[0], p_sim[0]
+        else:
+            permutations_run, p_sim = permutations_run.T, p_sim.T
+        self.permutations_run = permutations_run
+        return p_sim
+
+def permutation_draws(seed, size, n, max_neighbors):
+    """size rows of max_neighbors + 1 distinct cell indices, one spare for cells that draw themselves"""
+    rng = np.random.default_rng(seed)
+    return np.stack([rng.choice(n, size=max_neighbors + 1, replace=False) for _ in range(size)])
+
+def count_larger(y, draws, padded, cells, offset, denominator, observed):
+    """Per cell, how many of the draws give a random G at least the observed one
+
+    A cell's neighbours take the draws in order, skipping the cell itself,
+    which gives each cell a uniform sample of the other n - 1 cells.
+    """
+    k = padded.shape[1]
+    values = y[draws]
+    sums = padded @ values[:, :k].T
+    # Where a cell drew itself, its neighbours from there on take the next draw along
+    local = np.full(len(y), -1)
+    local[cells] = np.arange(len(cells))
+    perm, position = np.nonzero(local[draws[:, :k]] >= 0)
+    rows = local[draws[perm, position]]
+    steps = np.diff(values, axis=1)[perm] * (np.arange(k) >= position[:, None])
+    np.add.at(sums, (rows, perm), (padded[rows] * steps).sum(axis=1))
+    with np.errstate(divide='ignore', invalid='ignore'):
+        random_g = (sums + offset[:, None]) / denominator[:, None]
+    return (random_g >= observed[:, None]).sum(axis=1)
+
+def decided(larger, permutations_run):
+    """Cells whose folded p-value is clearly on one side of every significance cut-off
+
+    Uses the Wilson score interval at EARLY_STOP_Z.
+    """
+    p = np.minimum(larger, permutations_run - larger) / permutations_run
+    z2 = EARLY_STOP_Z**2 / permutations_run
+    centre = (p + z2 / 2) / (1 + z2)
+    half = EARLY_STOP_Z * np.sqrt(p * (1 - p) / permutations_run + z2 / (4 * permutations_run)) / (1 + z2)
+    levels = np.asarray(SIGNIFICANCE_LEVELS)[:, None]
+    return ((centre + half < levels) | (centre - half > levels)).all(axis=0)
+
+def permutation_block(task):
+    """Permutation counts for one block of cells, drawing chunk by chunk until every cell is decided"""
+    y, padded, cells, offset, denominator, observed, seeds, permutations, max_neighbors, early_stop = task
+    larger = np.zeros(len(cells))
+    permutations_run = np.zeros(len(cells), dtype=np.int64)
+    active = np.arange(len(cells))
+    drawn = 0
+    for seed in seeds:
+        if len(active) == 0:
+            break
+        size = min(PERMUTATION_CHUNK, permutations - drawn)
+        draws = permutation_draws(seed, size, len(y), max_neighbors)
+        drawn += size
+        larger[active] += count_larger(y, draws, padded[active], cells[active], offset[active],
+                                       denominator[active], observed[active])
+        permutations_run[active] = drawn
+        if early_stop:
+            active = active[~decided(larger[active], drawn)]
+    return larger, permutations_run
@@ -0,0 +1,58 @@
+import json
+import os
+import numpy as np
+import shapely
+from shapely.geometry import shape
+from utils.projection_utils import to_projected
+
+CITY_BOUNDARY_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'data', 'trv_city.geojson')
+
+CLIP_MODES = ['none', 'city', 'hull', 'both']
+
+class GridMask:
+    """Which cells of a regular projected grid have their centre inside a study area
+
+    The area is the city boundary, the incidents' convex hull grown by a
+    buffer, or (mode 'both') the part of the city inside that hull. Cells
+    outside it (sea, land beyond the city or far from any incident) are
+    neither evaluated nor stored by the grid analyses.
+    """
+
+    def __init__(self, area):
+        self.area = area
+        shapely.prepare(self.area)
+
+    @classmethod
+    def from_clip(cls, clip, x, y, buffer=1000, city_path=CITY_BOUNDARY_PATH):
+        """Mask for a --clip mode from projected incident coordinates; None for 'none'"""
+        if clip == 'none':
+            return None
+        if clip not in CLIP_MODES:
+            raise ValueError(f"Unknown clip mode: {clip} (choose from {', '.join(CLIP_MODES)})")
+
+        areas = []
+        if clip in ('city', 'both'):
+            areas.append(load_city_area(city_path))
+        if clip in ('hull', 'both'):
+            areas.append(shapely.multipoints(np.column_stack([x, y])).convex_hull.buffer(buffer))
+        return cls(shapely.intersection_all(areas))
+
+    def inside(self, x_centers, y_centers):
+        """Boolean array indexed [i, j] for the cell centred at (x_centers[i], y_centers[j])"""
+        x_grid, y_grid = np.meshgrid(np.asarray(x_centers, dtype=float), np.asarray(y_centers, dtype=float), indexing='ij')
+        return shapely.contains_xy(self.area, x_grid, y_grid)
+
+    def node_cells(self, x_range, y_range):
+        """Cell mask for a KDE node grid, where cell (i, j) spans nodes i..i+1 and j..j+1"""
+        x_range, y_range = np.asarray(x_range), np.asarray(y_range)
+        return self.inside((x_range[:-1] + x_range[1:]) / 2, (y_range[:-1] + y_range[1:]) / 2)
+
+    def describe(self, mask):
+        return f"{int(mask.sum())} of {mask.size} grid cells inside the clip area"
+
+def load_city_area(path=CITY_BOUNDARY_PATH):
+    """The city boundary polygons as one geometry in projected (UTM 43N) meters"""
+    with open(path, 'r') as f:
+        geojson_data = json.load(f)
+    city = shapely.union_all([shape(feature['geometry']) for feature in geojson_data['features']])
+    return shapely.transform(city, lambda coords: np.column_stack(to_projected(coords[:, 0], coords[:, 1])))
@@ -0,0 +1,36 @@
+import os
+from processors.table_cache import TableCache
+from processors.time_index import TimeIndex
+
+# Category fields the analyses can be split by (--by), keyed by option name
+GROUP_BY_COLUMNS = {
+    'main_type': 'ahp_weighted_event_types_main_type',
+    'severity': 'ahp_weighted_event_types_label'
+}
+
+def load_incident_input(start_date=None, end_date=None, df=None, csv_path=None):
+    """The incident table to analyse, date-filtered; None (with the reason printed) if empty"""
+    if df is not None:
+        print(f"Using {len(df)} rows passed in memory")
+    else:
+        print(f"Looking for CSV at: {csv_path}")
+        
+        # Check if input file exists
+        if not os.path.exists(csv_path):
+            print(f"Error: Input CSV file not found at {csv_path}")
+            return None
+        
+        # Read the CSV file (or its cached typed table)
+        df = TableCache().load(csv_path)
+        print(f"Loaded {len(df)} rows from CSV")
+    
+    # Filter by date range if provided
+    if start_date and end_date:
+        if 'date' in df.columns:
+            df = TimeIndex.from_frame(df, 'date').select(df, start_date, end_date)
+            print(f"Filtered data: {len(df)} records between {start_date} and {end_date}")
+    
+    if len(df) == 0:
+        print("No data available for the specified date range")
+        return None
+    return df
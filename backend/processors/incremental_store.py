@@ -0,0 +1,200 @@
+import pandas as pd
+import hashlib
+import json
+import glob
+import io
+import os
+from processors.table_cache import CACHE_DIR, type_incident_columns
+from utils.datetime_utils import parse_datetime_column
+
+try:
+    from pyarrow import feather
+except ImportError:
+    feather = None
+
+class IncrementalStore:
+    """Append-only store of prepared incidents with a high-water mark on the source feed"""
+
+    def __init__(self, store_dir=os.path.join(CACHE_DIR, 'incremental'), max_parts=30):
+        self.store_dir = store_dir
+        self.state_path = os.path.join(store_dir, 'state.json')
+        self.max_parts = max_parts
+        self.state = self._read_state()
+
+    def read_new_rows(self, source_path):
+        """Read only the rows appended to the source CSV since the last ingest
+
+        The file size is taken once up front and only the complete lines
+        before it are read, so rows the feed appends meanwhile (or a line
+        it is still writing) are left for the next ingest.
+        """
+        if feather is None:
+            raise RuntimeError("Incremental mode requires pyarrow")
+
+        source = os.path.abspath(source_path)
+        state = self.state
+        size = os.path.getsize(source_path)
+        if not state or state['source'] != source:
+            print("No ingest state for this source, processing the full file")
+            self.reset()
+            df, offset = self._read_lines(source_path, 0, size)
+            if offset > 0:
+                self._mark_read(source_path, df.columns.tolist(), offset)
+            return df
+
+        if size >= state['offset'] and self._tail_signature(source_path, state['offset']) == state['tail_signature']:
+            # Fast path: the file only grew, so parse just the appended bytes
+            new_rows, offset = self._read_lines(source_path, state['offset'], size, state['columns'])
+        else:
+            # The file was rewritten; re-read it but keep only rows past the high-water mark
+            print("Source file was rewritten, selecting new rows by high-water mark")
+            new_rows, offset = self._read_lines(source_path, 0, size)
+            new_rows = self._past_high_water_mark(new_rows)
+
+        self._mark_read(source_path, new_rows.columns.tolist(), offset)
+        print(f"Found {len(new_rows)} new rows in {os.path.basename(source_path)}")
+        return new_rows
+
+    def append(self, df):
+        """Append processed rows to the store and advance the high-water mark"""
+        if len(df) == 0:
+            return
+        os.makedirs(self.store_dir, exist_ok=True)
+        part_path = os.path.join(self.store_dir, f"part-{self.state['next_part']:05d}.feather")
+        type_incident_columns(df.copy(deep=False)).reset_index(drop=True).to_feather(part_path, compression='uncompressed')
+        self.state['next_part'] += 1
+
+        if 'event_id' in df.columns and df['event_id'].notna().any():
+            # Kept in its own Python type, so string ids and large integers survive the JSON state
+            latest_id = df['event_id'].max()
+            latest_id = latest_id.item() if hasattr(latest_id, 'item') else latest_id
+            if self.state['event_id'] is None or latest_id > self.state['event_id']:
+                self.state['event_id'] = latest_id
+        if 'signal_lan' in df.columns:
+            timestamps = pd.to_datetime(df['signal_lan'])
+            latest = timestamps.max()
+            mark = self.state['signal_lan']
+            if pd.notna(latest) and (mark is None or latest >= pd.Timestamp(mark)):
+                # Ids of the rows at the mark, so later rows sharing its timestamp can be told apart
+                ids = df.loc[timestamps == latest, 'event_id'].dropna().tolist() if 'event_id' in df.columns else []
+                if mark is not None and latest == pd.Timestamp(mark):
+                    ids = list(dict.fromkeys(self.state.get('boundary_ids', []) + ids))
+                self.state['signal_lan'] = latest.isoformat()
+                self.state['boundary_ids'] = ids
+
+        if len(self._part_paths()) > self.max_parts:
+            self._compact()
+
+    def load(self):
+        """Load every stored row as one typed DataFrame"""
+        parts = [feather.read_table(path, memory_map=True).to_pandas() for path in self._part_paths()]
+        if not parts:
+            return pd.DataFrame()
+        return type_incident_columns(pd.concat(parts, ignore_index=True))
+
+    def can_append_output(self, output_path, settings=None):
+        """Whether output_path still holds exactly the full store as last recorded by record_output"""
+        output = self.state.get('output')
+        if not output or output['path'] != os.path.abspath(output_path) or not os.path.exists(output_path):
+            return False
+        stat = os.stat(output_path)
+        return [stat.st_size, stat.st_mtime_ns] == output['signature'] and output.get('settings') == settings
+
+    def record_output(self, output_path, is_full_store, settings=None):
+        """Remember whether output_path holds the whole store, so later runs can append to it"""
+        if is_full_store:
+            stat = os.stat(output_path)
+            self.state['output'] = {
+                'path': os.path.abspath(output_path),
+                'signature': [stat.st_size, stat.st_mtime_ns],
+                'settings': settings
+            }
+        else:
+            self.state['output'] = None
+
+    def save_state(self):
+        """Persist the read offset and high-water mark"""
+        os.makedirs(self.store_dir, exist_ok=True)
+        with open(self.state_path, 'w') as f:
+            json.dump(self.state, f)
+
+    def reset(self):
+        """Drop all stored rows and start a new ingest state"""
+        for path in self._part_paths():
+            os.remove(path)
+        self.state = {
+            'source': None, 'columns': None, 'offset': 0, 'tail_signature': None,
+            'event_id': None, 'signal_lan': None, 'boundary_ids': [], 'next_part': 0, 'output': None
+        }
+
+    def _past_high_water_mark(self, df):
+        """Drop rows already stored, by the high-water mark on signal_lan, else on event_id
+
+        Rows at exactly the signal_lan mark are kept unless their event_id
+        was stored with it, so new incidents sharing the last timestamp are
+        not lost (without an event_id column they cannot be told apart and
+        are dropped). Event ids need not be ordered, so they only mark
+        progress when there are no timestamps.
+        """
+        if len(df) == 0:
+            return df
+        if 'signal_lan' in df.columns and self.state['signal_lan'] is not None:
+            timestamps, _ = parse_datetime_column(df['signal_lan'])
+            mark = pd.Timestamp(self.state['signal_lan'])
+            at_mark = (timestamps == mark).to_numpy()
+            if 'event_id' in df.columns:
+                at_mark &= df['event_id'].isin(self.state.get('boundary_ids', [])).to_numpy()
+            return df[~(timestamps < mark).to_numpy() & ~at_mark]
+        if 'event_id' in df.columns and self.state['event_id'] is not None:
+            return df[df['event_id'] > self.state['event_id']]
+        return df
+
+    def _read_lines(self, source_path, start, end, columns=None):
+        """Rows in the complete lines between byte offsets start and end, and the offset after them
+
+        With columns the bytes are headerless (appended rows), otherwise
+        they start with the header line. A last line without its newline is
+        still being written, so it is not read.
+        """
+        with open(source_path, 'rb') as f:
+            f.seek(start)
+            data = f.read(end - start)
+        data = data[:data.rfind(b'\n') + 1]
+        if not data.strip():
+            return pd.DataFrame(columns=columns or []), start + len(data)
+        if columns is None:
+            return pd.read_csv(io.BytesIO(data)), start + len(data)
+        return pd.read_csv(io.BytesIO(data), header=None, names=columns), start + len(data)
+
+    def _mark_read(self, source_path, columns, offset):
+        """Move the read offset to the end of the last line read"""
+        self.state.update({
+            'source': os.path.abspath(source_path),
+            'columns': columns,
+            'offset': offset,
+            'tail_signature': self._tail_signature(source_path, offset)
+        })
+
+    def _tail_signature(self, path, offset, length=65536):
+        """Hash of the bytes just before offset, used to detect a rewritten file"""
+        with open(path, 'rb') as f:
+            f.seek(max(0, offset - length))
+            return hashlib.blake2b(f.read(min(offset, length)), digest_size=16).hexdigest()
+
+    def _part_paths(self):
+        return sorted(glob.glob(os.path.join(self.store_dir, 'part-*.feather')))
+
+    def _compact(self):
+        """Merge all parts into one so loads stay a handful of file reads"""
+        merged = self.load()
+        for path in self._part_paths():
+            os.remove(path)
+        merged.to_feather(os.path.join(self.store_dir, f"part-{self.state['next_part']:05d}.feather"), compression='uncompressed')
+        self.state['next_part'] += 1
+
+    def _read_state(self):
+        try:
+            with open(self.state_path, 'r') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
@@ -0,0 +1,406 @@
+import copy
+import numpy as np
+from scipy import fft as sp_fft
+from scipy.signal import fftconvolve
+from scipy.spatial import cKDTree
+from scipy.stats import gaussian_kde
+from processors.parallel_processor import ParallelProcessor
+
+class BinnedKDE:
+    """Gaussian KDE on a regular grid via linear binning and FFT convolution
+
+    Uses the same bandwidth as scipy.stats.gaussian_kde (Scott's rule with
+    the weighted data covariance), so results agree with it up to
+    error_bound(). The cost is O(G log G) in the number of grid nodes G
+    plus O(n) binning, independent of how many incidents fall in a cell.
+    """
+
+    def __init__(self, coords, weights=None, truncate=5.0):
+        # gaussian_kde only computes the bandwidth here; no density is evaluated
+        reference = gaussian_kde(coords, weights=weights)
+        self.dataset = reference.dataset
+        self.weights = reference.weights
+        self.covariance = reference.covariance
+        self.precision = np.linalg.inv(self.covariance)
+        self.peak = 1.0 / (2 * np.pi * np.sqrt(np.linalg.det(self.covariance)))
+        self.truncate = truncate
+        # Kernel half-size in nodes; fixed when evaluating tiles of a larger grid
+        self.extent = None
+
+    # Working memory per grid node: binned weights, padded FFT buffers and the result
+    bytes_per_node = 64
+    # The convolution yields every node of a grid, so masks only skip whole tiles
+    pointwise = False
+
+    def evaluate_grid(self, x_range, y_range):
+        """Density at every grid node, shaped (len(y_range), len(x_range)) like np.meshgrid"""
+        binned = self.bin_weights(x_range, y_range)
+        return self.convolve(binned, self._spacing(x_range), self._spacing(y_range))
+
+    def kernel_extent(self, nx, ny, dx, dy):
+        """Kernel half-size in nodes: the box covering the truncation ellipse, at most the grid"""
+        if self.extent is not None:
+            return self.extent
+        kx = min(int(np.ceil(self.truncate * np.sqrt(self.covariance[0, 0]) / dx)), nx - 1)
+        ky = min(int(np.ceil(self.truncate * np.sqrt(self.covariance[1, 1]) / dy)), ny - 1)
+        return kx, ky
+
+    def halo(self, x_range, y_range):
+        """Nodes beyond a tile whose binned weight can reach into it (kernel extent plus one cell)"""
+        kx, ky = self.kernel_extent(len(x_range), len(y_range), self._spacing(x_range), self._spacing(y_range))
+        return kx + 1, ky + 1
+
+    def tile(self, x_range, y_range, halo):
+        """Engine for a halo'd sub-grid: only the incidents binned onto it, with the full grid's kernel"""
+        inside = ((self.dataset[0] >= x_range[0]) & (self.dataset[0] <= x_range[-1]) &
+                  (self.dataset[1] >= y_range[0]) & (self.dataset[1] <= y_range[-1]))
+        tile = copy.copy(self)
+        tile.dataset = self.dataset[:, inside]
+        tile.weights = self.weights[inside]
+        tile.extent = (halo[0] - 1, halo[1] - 1)
+        return tile
+
+    def convolve(self, binned, dx, dy):
+        """Density at the nodes of an already binned grid with node spacing dx, dy"""
+        ny, nx = binned.shape
+
+        kernel = self.kernel(*self.kernel_extent(nx, ny, dx, dy), dx, dy)
+
+        # Odd-sized kernel, so 'same' keeps node (j, i) aligned with the input grid
+        z = fftconvolve(binned, kernel, mode='same')
+        # FFT round-off can leave tiny negative values in empty areas
+        return np.maximum(z, 0.0)
+
+    def kernel(self, kx, ky, dx, dy):
+        """Kernel sampled at node offsets within kx, ky nodes, shaped (2 ky + 1, 2 kx + 1)"""
+        offset_x, offset_y = np.meshgrid(np.arange(-kx, kx + 1) * dx, np.arange(-ky, ky + 1) * dy)
+        p = self.precision
+        q = p[0, 0] * offset_x**2 + 2 * p[0, 1] * offset_x * offset_y + p[1, 1] * offset_y**2
+        return self.peak * np.exp(-0.5 * q)
+
+    def bin_weights(self, x_range, y_range):
+        """Linear binning: each incident's weight is split over the 4 surrounding grid nodes"""
+        nx, ny = len(x_range), len(y_range)
+        fx = (self.dataset[0] - x_range[0]) / self._spacing(x_range)
+        fy = (self.dataset[1] - y_range[0]) / self._spacing(y_range)
+        ix = np.clip(np.floor(fx), 0, nx - 1).astype(np.int64)
+        iy = np.clip(np.floor(fy), 0, ny - 1).astype(np.int64)
+        tx = np.clip(fx - ix, 0.0, 1.0)
+        ty = np.clip(fy - iy, 0.0, 1.0)
+
+        # One spare row and column take the (zero) share of points on the last node
+        width = nx + 1
+        binned = np.zeros((ny + 1) * width)
+        for shift_y, share_y in ((0, 1 - ty), (1, ty)):
+            for shift_x, share_x in ((0, 1 - tx), (1, tx)):
+                cells = (iy + shift_y) * width + ix + shift_x
+                binned += np.bincount(cells, weights=self.weights * share_x * share_y, minlength=binned.size)
+        return binned.reshape(ny + 1, width)[:ny, :nx]
+
+    def error_bound(self, x_range, y_range):
+        """Upper bound on |binned - exact| density at any grid node
+
+        Linear binning is bilinear interpolation of each kernel, off by at
+        most (dx^2 * max|K_xx| + dy^2 * max|K_yy|) / 8 with max|K_xx| =
+        peak * P_xx (P the inverse covariance). Cutting the kernel at
+        `truncate` standard deviations drops at most peak * exp(-truncate^2 / 2).
+        Both are per unit weight, and the weights sum to 1.
+        """
+        dx, dy = self._spacing(x_range), self._spacing(y_range)
+        binning = (dx**2 * self.precision[0, 0] + dy**2 * self.precision[1, 1]) * self.peak / 8
+        truncation = self.peak * np.exp(-self.truncate**2 / 2)
+        return binning + truncation
+
+    def _spacing(self, nodes):
+        return nodes[1] - nodes[0] if len(nodes) > 1 else 1.0
+
+def decimate_binned(binned):
+    """Linear binning at twice the node spacing, from linearly binned weights
+
+    Every second node is kept, and each dropped node's weight is split
+    evenly between its two kept neighbours (a [0.5, 1, 0.5] tent along each
+    axis). That gives exactly the weights linear binning onto the coarser
+    grid would, so a pyramid of levels needs the incidents binned only once.
+    """
+    for axis in (0, 1):
+        binned = np.moveaxis(binned, axis, 0)
+        n = binned.shape[0]
+        coarse = n // 2 + 1
+        padded = np.zeros((2 * coarse + 1,) + binned.shape[1:])
+        padded[:n] = binned
+        kept, dropped = padded[0:2 * coarse:2], padded[1:2 * coarse + 1:2]
+        merged = kept + 0.5 * dropped
+        merged[1:] += 0.5 * dropped[:-1]
+        binned = np.moveaxis(merged, 0, axis)
+    return binned
+
+class CategoryKDE:
+    """Binned FFT KDE surfaces for several categories of incidents on one shared grid
+
+    Each category keeps its own gaussian_kde bandwidth, so a surface is what
+    BinnedKDE would give for that category alone on the same grid. The
+    categories are binned onto the shared grid, and layers whose kernels
+    need the same transform size are convolved as one batched real FFT
+    over the stacked grids, so N surfaces cost about one pass over a grid
+    N layers deep rather than N separate runs.
+    Categories with fewer than min_count incidents (or a degenerate
+    spread, e.g. all at one point) have no defined bandwidth and are skipped.
+    """
+
+    def __init__(self, coords, categories, weights=None, truncate=5.0, min_count=3, workers=1):
+        coords = np.asarray(coords, dtype=float)
+        weights = np.ones(coords.shape[1]) if weights is None else np.asarray(weights, dtype=float)
+        labels, codes = np.unique(np.asarray(categories), return_inverse=True)
+        self.workers = workers
+        self.labels = []
+        self.engines = []
+        self.skipped = []
+        for code, label in enumerate(labels):
+            members = codes == code
+            if members.sum() < min_count:
+                self.skipped.append(label)
+                continue
+            try:
+                engine = BinnedKDE(coords[:, members], weights=weights[members], truncate=truncate)
+            except (np.linalg.LinAlgError, ValueError):
+                self.skipped.append(label)
+                continue
+            self.labels.append(label)
+            self.engines.append(engine)
+
+    def evaluate_grid(self, x_range, y_range):
+        """Densities shaped (len(labels), len(y_range), len(x_range)), one layer per category"""
+        nx, ny = len(x_range), len(y_range)
+        if not self.engines:
+            return np.zeros((0, ny, nx))
+        dx, dy = self.engines[0]._spacing(x_range), self.engines[0]._spacing(y_range)
+
+        # With the kernel centred at the origin, a circular convolution of n + k
+        # nodes per axis reproduces mode='same' in nodes 0..n-1: the wrapped-around
+        # part lands in the padding beyond them
+        extents = [engine.kernel_extent(nx, ny, dx, dy) for engine in self.engines]
+        shapes = [(sp_fft.next_fast_len(ny + ky, real=True), sp_fft.next_fast_len(nx + kx, real=True))
+                  for kx, ky in extents]
+
+        z = np.empty((len(self.engines), ny, nx))
+        for shape in sorted(set(shapes)):
+            layers = [i for i, s in enumerate(shapes) if s == shape]
+            binned = np.zeros((len(layers),) + shape)
+            kernels = np.zeros((len(layers),) + shape)
+            for row, i in enumerate(layers):
+                kx, ky = extents[i]
+                binned[row, :ny, :nx] = self.engines[i].bin_weights(x_range, y_range)
+                # Kernel centre at the origin, negative offsets wrapped to the far end
+                kernel = self.engines[i].kernel(kx, ky, dx, dy)
+                kernels[row] = np.roll(np.pad(kernel, ((0, shape[0] - kernel.shape[0]), (0, shape[1] - kernel.shape[1]))),
+                                       (-ky, -kx), axis=(0, 1))
+
+            # All layers of this size in one batched transform
+            spectrum = sp_fft.rfft2(binned, workers=self.workers)
+            spectrum *= sp_fft.rfft2(kernels, workers=self.workers)
+            z[layers] = sp_fft.irfft2(spectrum, shape, workers=self.workers)[:, :ny, :nx]
+        # FFT round-off can leave tiny negative values in empty areas
+        return np.maximum(z, 0.0)
+
+    def error_bound(self, x_range, y_range):
+        """Largest per-category bound on |binned - exact| density (see BinnedKDE.error_bound)"""
+        return max((engine.error_bound(x_range, y_range) for engine in self.engines), default=0.0)
+
+class ExactKDE:
+    """scipy.stats.gaussian_kde summed over every incident at every grid node"""
+
+    bytes_per_node = 64
+    pointwise = True
+
+    def __init__(self, coords, weights=None):
+        self.reference = gaussian_kde(coords, weights=weights)
+
+    def evaluate(self, positions):
+        """Density at positions of shape (2, m)"""
+        return self.reference(positions)
+
+    def evaluate_grid(self, x_range, y_range):
+        """Density at every grid node, shaped (len(y_range), len(x_range)) like np.meshgrid"""
+        x_grid, y_grid = np.meshgrid(x_range, y_range)
+        return self.reference(np.vstack([x_grid.ravel(), y_grid.ravel()])).reshape(x_grid.shape)
+
+    def halo(self, x_range, y_range):
+        return 0, 0
+
+    def tile(self, x_range, y_range, halo):
+        return self
+
+class TreeKDE:
+    """Gaussian KDE summed over a KD-tree of incidents with a truncated kernel
+
+    Coordinates are whitened with the gaussian_kde covariance, so the kernel
+    is cut off at `cutoff` bandwidths in every direction and only incidents
+    within that radius of a node are visited. Each incident left out adds
+    at most peak * exp(-r^2 / 2) times its weight; nodes where that tail
+    could exceed atol + rtol * density are re-summed with a radius large
+    enough to meet the tolerance, so every value is within it of gaussian_kde.
+    """
+
+    def __init__(self, coords, weights=None, cutoff=4.0, atol=None, rtol=1e-3, max_pairs=2000000):
+        reference = gaussian_kde(coords, weights=weights)
+        self.weights = reference.weights
+        self.covariance = reference.covariance
+        self.whitening = np.linalg.inv(np.linalg.cholesky(self.covariance))
+        self.peak = 1.0 / (2 * np.pi * np.sqrt(np.linalg.det(self.covariance)))
+        self.cutoff = cutoff
+        # By default the tolerance is what the cutoff alone guarantees, so no node is refined
+        self.atol = self.peak * np.exp(-cutoff**2 / 2) if atol is None else atol
+        self.rtol = rtol
+        self.max_pairs = max_pairs
+        self.tree = cKDTree((self.whitening @ reference.dataset).T)
+
+    # Working memory per grid node (positions, sums, tolerances), on top of the pair chunks
+    bytes_per_node = 96
+    pointwise = True
+
+    def evaluate(self, positions):
+        """Density at positions of shape (2, m)"""
+        points = (self.whitening @ np.asarray(positions, dtype=float)).T
+        density, included = self._sum_within(points, self.cutoff)
+
+        tail = self.peak * np.exp(-self.cutoff**2 / 2) * np.clip(1.0 - included, 0.0, None)
+        tolerance = self.atol + self.rtol * density
+        refine = np.flatnonzero(tail > tolerance)
+        if refine.size:
+            # Smallest radius whose tail bound meets the tolerance (all incidents if it is zero)
+            with np.errstate(divide='ignore'):
+                radius = np.sqrt(2 * np.log(self.peak * (1.0 - included[refine]) / tolerance[refine]))
+            print(f"Refining {refine.size} of {len(points)} nodes to meet the KDE tolerance")
+            density[refine], _ = self._sum_within(points[refine], radius)
+        return density
+
+    def evaluate_grid(self, x_range, y_range):
+        """Density at every grid node, shaped (len(y_range), len(x_range)) like np.meshgrid"""
+        x_grid, y_grid = np.meshgrid(x_range, y_range)
+        return self.evaluate(np.vstack([x_grid.ravel(), y_grid.ravel()])).reshape(x_grid.shape)
+
+    def halo(self, x_range, y_range):
+        return 0, 0
+
+    def tile(self, x_range, y_range, halo):
+        return self
+
+    def _sum_within(self, points, radius):
+        """Kernel sums and included weight over incidents within radius (scalar or per point)"""
+        radius = np.broadcast_to(np.asarray(radius, dtype=float), (len(points),))
+        density = np.zeros(len(points))
+        included = np.zeros(len(points))
+
+        # Nodes with no incident in range are skipped; the rest are summed in
+        # chunks of about max_pairs (node, incident) pairs to bound memory
+        counts = self.tree.query_ball_point(points, radius, return_length=True)
+        active = np.flatnonzero(counts)
+        cumulative = np.cumsum(counts[active])
+        splits = np.searchsorted(cumulative, np.arange(self.max_pairs, cumulative[-1], self.max_pairs)) if active.size else []
+
+        for chunk in np.split(active, splits):
+            if chunk.size == 0:
+                continue
+            chunk_radius = radius[chunk]
+            pairs = cKDTree(points[chunk]).sparse_distance_matrix(
+                self.tree, chunk_radius.max(), output_type='ndarray')
+            keep = pairs['v'] <= chunk_radius[pairs['i']]
+            node, incident, distance = pairs['i'][keep], pairs['j'][keep], pairs['v'][keep]
+            weight = self.weights[incident]
+            density[chunk] = self.peak * np.bincount(node, weights=weight * np.exp(-0.5 * distance**2), minlength=chunk.size)
+            included[chunk] = np.bincount(node, weights=weight, minlength=chunk.size)
+        return density, included
+
+class TiledKDE:
+    """Evaluate a KDE engine's grid in tiles across a process pool, within a memory cap
+
+    The grid is cut into rectangular tiles, each extended by the engine's
+    halo (the nodes whose incidents can reach into it) and evaluated on its
+    own, and the tile interiors are stitched back into one array. Each
+    node's density depends only on incidents within the halo, so the result
+    matches evaluating the whole grid at once. Tiles are sized so that the
+    stitched result plus one working tile per worker stays roughly under
+    max_memory_mb (by each engine's bytes_per_node estimate), and small
+    enough that every worker gets several.
+
+    With a node mask (see GridMask), tiles without a masked-in node are
+    skipped and, for engines that evaluate point by point, only the
+    masked-in nodes are computed; the rest of the grid is left at zero.
+    """
+
+    def __init__(self, kde, workers=1, max_memory_mb=None, tiles_per_worker=2):
+        self.kde = kde
+        self.workers = max(1, workers or 1)
+        self.max_memory_mb = max_memory_mb
+        self.tiles_per_worker = tiles_per_worker
+
+    def evaluate_grid(self, x_range, y_range, mask=None):
+        """Density at every grid node, shaped (len(y_range), len(x_range)) like np.meshgrid
+
+        mask, shaped like the result, selects the nodes that are needed.
+        """
+        nx, ny = len(x_range), len(y_range)
+        halo = self.kde.halo(x_range, y_range)
+        tile_x, tile_y = self.tile_shape(nx, ny, halo)
+        if tile_x >= nx and tile_y >= ny and mask is None:
+            return self.kde.evaluate_grid(x_range, y_range)
+
+        tiles = [(slice(r, min(r + tile_y, ny)), slice(c, min(c + tile_x, nx)))
+                 for r in range(0, ny, tile_y) for c in range(0, nx, tile_x)]
+        if mask is not None:
+            tiles = [(rows, cols) for rows, cols in tiles if mask[rows, cols].any()]
+        print(f"Evaluating {nx}x{ny} grid in {len(tiles)} tiles of up to {tile_x}x{tile_y} nodes "
+              f"on {self.workers} worker(s)")
+
+        tasks = (self._tile_task(x_range, y_range, rows, cols, halo, mask) for rows, cols in tiles)
+        if self.workers > 1:
+            results = ParallelProcessor(self.workers).map_ordered(evaluate_tile, tasks)
+        else:
+            results = map(evaluate_tile, tasks)
+
+        z = np.zeros((ny, nx))
+        for (rows, cols), values in zip(tiles, results):
+            z[rows, cols] = values
+        return z
+
+    def tile_shape(self, nx, ny, halo):
+        """Tile size in nodes (excluding halo) from the worker count and memory cap"""
+        if self.workers == 1 and self.max_memory_mb is None:
+            return nx, ny
+        # Enough tiles to keep every worker busy
+        side = max(nx, ny) if self.workers == 1 else int(np.ceil(np.sqrt(nx * ny / (self.workers * self.tiles_per_worker))))
+        if self.max_memory_mb is not None:
+            # The stitched result is held once; each worker holds one halo'd tile
+            budget = self.max_memory_mb * 2**20 - nx * ny * 8
+            nodes = budget / self.workers / self.kde.bytes_per_node
+            hx, hy = halo
+            # Largest s with (s + 2 hx) (s + 2 hy) <= nodes; halos stop at the grid edge,
+            # so the whole grid as one tile needs only nx * ny
+            fit = max(nx, ny) if nodes >= nx * ny else int(np.sqrt((hx - hy)**2 + max(nodes, 0)) - (hx + hy))
+            if fit < 1:
+                raise ValueError(f"max_memory_mb={self.max_memory_mb} is too small for a {nx}x{ny} grid "
+                                 f"with a {hx}x{hy}-node kernel halo on {self.workers} worker(s)")
+            side = min(side, fit)
+        return min(side, nx), min(side, ny)
+
+    def _tile_task(self, x_range, y_range, rows, cols, halo, mask=None):
+        """The engine, halo'd node ranges, interior crop and (pointwise engines) node mask for one tile"""
+        hx, hy = halo
+        col_lo, col_hi = max(cols.start - hx, 0), min(cols.stop + hx, len(x_range))
+        row_lo, row_hi = max(rows.start - hy, 0), min(rows.stop + hy, len(y_range))
+        x_tile, y_tile = x_range[col_lo:col_hi], y_range[row_lo:row_hi]
+        crop = (slice(rows.start - row_lo, rows.stop - row_lo), slice(cols.start - col_lo, cols.stop - col_lo))
+        tile_mask = mask[rows, cols] if mask is not None and self.kde.pointwise else None
+        return self.kde.tile(x_tile, y_tile, halo), x_tile, y_tile, crop, tile_mask
+
+def evaluate_tile(task):
+    """Interior densities of one halo'd tile (module level so worker processes can run it)"""
+    kde, x_range, y_range, crop, mask = task
+    if mask is None:
+        return kde.evaluate_grid(x_range, y_range)[crop]
+
+    # Pointwise engines have no halo, so the tile is its own interior
+    values = np.zeros(mask.shape)
+    rows, cols = np.nonzero(mask)
+    values[rows, cols] = kde.evaluate(np.vstack([x_range[cols], y_range[rows]]))
+    return values
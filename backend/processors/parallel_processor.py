@@ -0,0 +1,64 @@
+import pandas as pd
+import numpy as np
+import os
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+
+class ParallelProcessor:
+    """Run the row-independent preprocessing stages across a process pool"""
+
+    def __init__(self, workers=None, min_shard_rows=10000):
+        self.workers = workers or os.cpu_count()
+        self.min_shard_rows = min_shard_rows
+        self._pool = None
+
+    def __enter__(self):
+        """Keep one pool open for every map_ordered call until exit, rather than starting one per call"""
+        self._pool = ProcessPoolExecutor(max_workers=self.workers)
+        return self
+
+    def __exit__(self, *exc_info):
+        self._pool.shutdown()
+        self._pool = None
+
+    def prepare(self, df, data_loader, spatial_processor, police_df, city_geometries):
+        """Prepare shards of df in parallel and merge them back in their original order"""
+        n_shards = min(self.workers * 4, max(1, len(df) // self.min_shard_rows))
+        if self.workers <= 1 or n_shards <= 1:
+            return prepare_shard(df, data_loader, spatial_processor, police_df, city_geometries)
+
+        print(f"Preparing {len(df)} rows in {n_shards} shards on {self.workers} workers")
+        shards = [df.iloc[positions] for positions in np.array_split(np.arange(len(df)), n_shards)]
+        worker = partial(prepare_shard, data_loader=data_loader, spatial_processor=spatial_processor,
+                         police_df=police_df, city_geometries=city_geometries)
+        return pd.concat(list(self.map_ordered(worker, shards)))
+
+    def map_ordered(self, func, items, max_pending=None):
+        """Apply func to items in the pool, yielding results in input order
+
+        At most max_pending items (default: twice the worker count) are in
+        flight, so a lazy iterable such as a chunked CSV reader is never
+        read far ahead of the consumer.
+        """
+        max_pending = max_pending or self.workers * 2
+        if self._pool is not None:
+            yield from _submit_ordered(self._pool, func, items, max_pending)
+        else:
+            with ProcessPoolExecutor(max_workers=self.workers) as pool:
+                yield from _submit_ordered(pool, func, items, max_pending)
+
+def _submit_ordered(pool, func, items, max_pending):
+    """Submit func(item) for each item to pool, yielding results in input order"""
+    pending = deque()
+    for item in items:
+        pending.append(pool.submit(func, item))
+        if len(pending) >= max_pending:
+            yield pending.popleft().result()
+    while pending:
+        yield pending.popleft().result()
+
+def prepare_shard(shard, data_loader, spatial_processor, police_df, city_geometries):
+    """Parse dates, classify city membership and add nearest-station distances for one shard"""
+    shard = data_loader.prepare_data(shard, city_geometries)
+    return spatial_processor.add_police_distance(shard, police_df)
@@ -0,0 +1,90 @@
+import numpy as np
+import pandas as pd
+from scipy import sparse
+from scipy.stats import norm
+
+def time_bin_index(dates, bin_edges):
+    """Bin of each timestamp between consecutive bin_edges, -1 outside them
+
+    Bins are closed on the right and the first one also on the left, as
+    pd.cut(dates, bins=bin_edges, include_lowest=True) makes them.
+    """
+    values = np.asarray(dates, dtype='datetime64[ns]')
+    edges = np.asarray(bin_edges, dtype='datetime64[ns]')
+    bins = np.searchsorted(edges, values, side='left') - 1
+    bins[values == edges[0]] = 0
+    return np.where((bins >= 0) & (bins < len(edges) - 1), bins, -1)
+
+class SpaceTimeCube:
+    """Incident counts per grid cell and time bin, as a sparse cells x bins matrix
+
+    Takes each counted incident's cell (its row in the cube) and time bin
+    index; the counts are summed in one sparse COO-to-CSR conversion.
+    Only the bins holding at least one incident are kept, in time order,
+    with their pd.cut interval labels in time_bins.
+    """
+
+    def __init__(self, cells, bins, n_cells, bin_edges):
+        observed = np.unique(bins)
+        self.counts = sparse.coo_matrix(
+            (np.ones(len(cells), dtype=np.int64), (cells, np.searchsorted(observed, bins))),
+            shape=(n_cells, len(observed))
+        ).tocsr()
+        labels = pd.cut(pd.Series(bin_edges), bins=bin_edges, include_lowest=True).cat.categories
+        self.time_bins = labels[observed]
+
+    @property
+    def shape(self):
+        return self.counts.shape
+
+    def populated(self):
+        """Rows of the cells with at least one incident"""
+        return np.flatnonzero(self.counts.getnnz(axis=1))
+
+    def series(self, cells):
+        """Dense counts per time bin for the given cells, shaped (cells, bins)"""
+        return self.counts[cells].toarray()
+
+    def window_sums(self, width):
+        """Sparse (cells, bins - width) counts, column m summing bins m to m + width - 1
+
+        All sliding windows come from one sparse product with a banded
+        bins x windows indicator matrix.
+        """
+        n_bins = self.shape[1]
+        starts = np.arange(max(n_bins - width, 0))
+        bins = (starts[:, None] + np.arange(width)).ravel()
+        band = sparse.csr_matrix(
+            (np.ones(len(bins), dtype=np.int64), (bins, np.repeat(starts, width))),
+            shape=(n_bins, len(starts))
+        )
+        return (self.counts @ band).tocsc()
+
+def mann_kendall_trends(series, alpha=0.05, max_elements=2**22):
+    """Mann-Kendall trend ('increasing', 'decreasing' or 'no trend') of each row of series
+
+    The same test as pymannkendall.original_test, with its tie-corrected
+    variance and continuity correction, for all rows at once and without
+    the Sen's slope it also computes.
+    """
+    series = np.asarray(series)
+    rows, n = series.shape
+    earlier, later = np.triu_indices(n, 1)
+    s = np.zeros(rows)
+    block = max(1, max_elements // max(1, len(earlier)))
+    for start in range(0, rows, block):
+        part = series[start:start + block]
+        s[start:start + block] = np.sign(part[:, later] - part[:, earlier]).sum(axis=1)
+
+    # Tie correction from the sizes of the runs of equal values in each sorted row
+    ordered = np.sort(series, axis=1)
+    new_value = np.ones((rows, n), dtype=bool)
+    new_value[:, 1:] = ordered[:, 1:] != ordered[:, :-1]
+    run = np.cumsum(new_value, axis=1) - 1 + np.arange(rows)[:, None] * n
+    ties = np.bincount(run.ravel(), minlength=rows * n).reshape(rows, n)
+    var_s = (n * (n - 1) * (2 * n + 5) - (ties * (ties - 1) * (2 * ties + 5)).sum(axis=1)) / 18
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        z = np.where(s > 0, (s - 1) / np.sqrt(var_s), np.where(s < 0, (s + 1) / np.sqrt(var_s), 0.0))
+    significant = np.abs(z) > norm.ppf(1 - alpha / 2)
+    return np.where(significant & (z > 0), 'increasing', np.where(significant & (z < 0), 'decreasing', 'no trend'))
@@ -5,21 +5,44 @@ class SpatialProcessor:
     def __init__(self, earth_radius=6371000, exclusion_radius=250):
         self.earth_radius = earth_radius
         self.exclusion_radius = exclusion_radius
+        self._tree = None
+        self._tree_source = None
     
-    def remove_near_police_stations(self, crime_df, police_df):
-        """Remove crime points near police stations"""
-        # Convert coordinates to radians
-        police_coords = np.radians(police_df[['latitude', 'longitude']].values)
-        crime_coords = np.radians(crime_df[['latitude', 'longitude']].values)
+    def add_police_distance(self, crime_df, police_df):
+        """Add the distance (m) to, and id of, each crime point's nearest police station"""
+        if len(crime_df) == 0:
+            crime_df['nearest_ps_distance'] = np.array([], dtype=float)
+            crime_df['nearest_ps_id'] = np.array([], dtype=police_df['gid'].dtype if 'gid' in police_df.columns else int)
+            return crime_df
         
-        # Build spatial index
-        tree = BallTree(police_coords, metric='haversine')
+        # Find the single nearest station for every crime point
+        crime_coords = np.radians(crime_df[['latitude', 'longitude']].values)
+        distances, indices = self._police_tree(police_df).query(crime_coords, k=1)
         
-        # Find points within exclusion radius
-        radius_in_radians = self.exclusion_radius / self.earth_radius
-        indices = tree.query_radius(crime_coords, r=radius_in_radians)
+        station_ids = police_df['gid'].values if 'gid' in police_df.columns else police_df.index.values
+        crime_df['nearest_ps_distance'] = distances[:, 0] * self.earth_radius
+        crime_df['nearest_ps_id'] = station_ids[indices[:, 0]]
+        return crime_df
+    
+    def remove_near_police_stations(self, crime_df, police_df=None, radius=None):
+        """Remove crime points near police stations"""
+        radius = self.exclusion_radius if radius is None else radius
         
-        # Create mask for points NOT near police stations
-        mask = [len(idx) == 0 for idx in indices]
+        # The distance column is computed once at ingest; any radius is then a plain comparison
+        if 'nearest_ps_distance' not in crime_df.columns:
+            crime_df = self.add_police_distance(crime_df, police_df)
         
-        return crime_df[mask]
\ No newline at end of file
+        return crime_df[crime_df['nearest_ps_distance'].values > radius]
+    
+    def exclusion_masks(self, crime_df, radii):
+        """Keep-masks for several exclusion radii, for sensitivity analysis"""
+        distances = crime_df['nearest_ps_distance'].values
+        return {radius: distances > radius for radius in radii}
+    
+    def _police_tree(self, police_df):
+        """Haversine BallTree over the police stations, reused while the same table is passed"""
+        if self._tree_source is not police_df:
+            police_coords = np.radians(police_df[['latitude', 'longitude']].values)
+            self._tree = BallTree(police_coords, metric='haversine')
+            self._tree_source = police_df
+        return self._tree
\ No newline at end of file
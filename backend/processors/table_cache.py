@@ -0,0 +1,155 @@
+import pandas as pd
+import hashlib
+import json
+import glob
+import os
+from utils.datetime_utils import parse_datetime_column
+
+try:
+    from pyarrow import feather
+except ImportError:
+    feather = None
+
+CACHE_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), '.cache')
+
+CATEGORY_COLUMNS = [
+    'ahp_weighted_event_types_main_type',
+    'ahp_weighted_event_types_sub_type',
+    'ahp_weighted_event_types_label',
+    'part_of_day'
+]
+
+class TableCache:
+    """Feather snapshots of prepared incident tables, keyed by source content hash"""
+
+    def __init__(self, cache_dir=CACHE_DIR, log=print):
+        self.cache_dir = cache_dir
+        self.log = log
+        self.index_path = os.path.join(cache_dir, 'hash_index.json')
+
+    def load(self, source_path, prepare=None, tag='table', depends_on=()):
+        """Load the prepared table for a CSV, parsing it only on a cache miss
+
+        On a hit, numeric and datetime columns without nulls are read-only
+        views of the memory-mapped file (one block per column, so pandas
+        does not consolidate them into a copy). Categorical and boolean
+        columns are still converted, as Arrow stores them differently
+        from pandas.
+        """
+        cache_path = self._cache_path(source_path, tag, depends_on)
+
+        if feather is not None and os.path.exists(cache_path):
+            try:
+                df = feather.read_table(cache_path, memory_map=True).to_pandas(split_blocks=True)
+                self.log(f"Loaded cached table for {os.path.basename(source_path)} ({len(df)} rows)")
+                return df
+            except Exception as e:
+                self.log(f"Ignoring unreadable cache file {cache_path}: {e}")
+
+        df = pd.read_csv(source_path, low_memory=False)
+        df = type_incident_columns(prepare(df) if prepare else df)
+        self._write(df, cache_path)
+        return df
+
+    def store(self, source_path, df, tag='table', depends_on=()):
+        """Cache a table that was just written to source_path so readers skip the CSV parse"""
+        df = type_incident_columns(df.copy(deep=False))
+        self._write(df, self._cache_path(source_path, tag, depends_on))
+
+    def content_hash(self, path):
+        """Content hash of a file, reused while its size and mtime are unchanged"""
+        stat = os.stat(path)
+        signature = [stat.st_size, stat.st_mtime_ns]
+        index = self._read_index()
+        entry = index.get(os.path.abspath(path))
+        if entry and entry['signature'] == signature:
+            return entry['hash']
+
+        digest = hashlib.blake2b(digest_size=16)
+        with open(path, 'rb') as f:
+            for block in iter(lambda: f.read(1 << 20), b''):
+                digest.update(block)
+
+        index[os.path.abspath(path)] = {'signature': signature, 'hash': digest.hexdigest()}
+        self._write_index(index)
+        return digest.hexdigest()
+
+    def artifact_path(self, source_path, name, extension, depends_on=()):
+        """Path for a derived file (e.g. an index) tied to the same content key as the table"""
+        return self._cache_path(source_path, name, depends_on, extension)
+
+    def write_artifact(self, artifact_path, writer):
+        """Write a derived file with writer(path) and drop stale versions of it"""
+        try:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            self._remove_stale(artifact_path)
+            # np.savez appends .npz to names without it, so keep the extension on the temp file
+            root, extension = os.path.splitext(artifact_path)
+            temp_path = f"{root}.tmp{extension}"
+            writer(temp_path)
+            os.replace(temp_path, artifact_path)
+        except Exception as e:
+            self.log(f"Could not write cache file {artifact_path}: {e}")
+
+    def _cache_path(self, source_path, tag, depends_on, extension='feather'):
+        """Cache file name for a source file, tag and any files the preparation reads"""
+        key = self.content_hash(source_path)
+        if depends_on:
+            combined = '|'.join([key] + [self.content_hash(path) for path in depends_on])
+            key = hashlib.blake2b(combined.encode(), digest_size=16).hexdigest()
+        source = os.path.abspath(source_path)
+        # The path hash keeps same-named sources in different directories from evicting each other
+        location = hashlib.blake2b(source.encode(), digest_size=4).hexdigest()
+        stem = os.path.splitext(os.path.basename(source))[0]
+        return os.path.join(self.cache_dir, f"{stem}-{location}.{tag}.{key}.{extension}")
+
+    def _remove_stale(self, cache_path):
+        """Drop entries for the same source and tag that were keyed by an older hash"""
+        prefix, _, extension = os.path.basename(cache_path).rsplit('.', 2)
+        for stale in glob.glob(os.path.join(self.cache_dir, f"{glob.escape(prefix)}.*.{extension}")):
+            if stale != cache_path:
+                os.remove(stale)
+
+    def _write(self, df, cache_path):
+        """Write a cache entry and drop stale entries for the same source and tag"""
+        if feather is None:
+            return
+        try:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            self._remove_stale(cache_path)
+
+            # Uncompressed so the file can be memory-mapped on read
+            temp_path = cache_path + '.tmp'
+            df.reset_index(drop=True).to_feather(temp_path, compression='uncompressed')
+            os.replace(temp_path, cache_path)
+        except Exception as e:
+            self.log(f"Could not write cache file {cache_path}: {e}")
+
+    def _read_index(self):
+        try:
+            with open(self.index_path, 'r') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def _write_index(self, index):
+        try:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            with open(self.index_path, 'w') as f:
+                json.dump(index, f)
+        except OSError:
+            pass
+
+def type_incident_columns(df):
+    """Give incident columns their analysis dtypes: datetimes, categoricals and booleans"""
+    if 'signal_lan' in df.columns and not pd.api.types.is_datetime64_any_dtype(df['signal_lan']):
+        df['signal_lan'], _ = parse_datetime_column(df['signal_lan'])
+
+    for col in CATEGORY_COLUMNS:
+        if col in df.columns and df[col].dtype == object:
+            df[col] = df[col].astype('category')
+
+    if 'inside_trvcity' in df.columns and df['inside_trvcity'].dtype == object:
+        df['inside_trvcity'] = df['inside_trvcity'].map({'True': True, 'False': False, True: True, False: False})
+
+    return df
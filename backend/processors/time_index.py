@@ -0,0 +1,66 @@
+import pandas as pd
+import numpy as np
+
+class TimeIndex:
+    """Binary-search range lookups over a timestamp column
+
+    assume_sorted skips the order check for a datetime column known to be
+    in time order (e.g. a table sort_by_time produced), so building the
+    index costs nothing and every range lookup is O(log n).
+    """
+
+    def __init__(self, timestamps, assume_sorted=False):
+        timestamps = timestamps if isinstance(timestamps, pd.Series) else pd.Series(timestamps)
+        if pd.api.types.is_datetime64_dtype(timestamps) and (assume_sorted or timestamps.is_monotonic_increasing):
+            # An already parsed, time-ordered column is searched as it is: no parse, copy or argsort
+            self.n_rows = len(timestamps)
+            self.order = None
+            self.sorted_values = timestamps.to_numpy(dtype='datetime64[ns]')
+            return
+
+        values = pd.to_datetime(timestamps, errors='coerce').to_numpy(dtype='datetime64[ns]')
+        valid = ~np.isnat(values)
+        self.n_rows = len(values)
+
+        if valid.all() and (self.n_rows < 2 or (values[1:] >= values[:-1]).all()):
+            # Rows are already in time order, so every range is a contiguous slice
+            self.order = None
+            self.sorted_values = values
+        else:
+            # Missing timestamps never match a range (as with a comparison mask), so leave them out
+            self.order = np.argsort(values, kind='stable')[:int(valid.sum())]
+            self.sorted_values = values[self.order]
+
+    @classmethod
+    def from_frame(cls, df, column='signal_lan', assume_sorted=False):
+        return cls(df[column], assume_sorted)
+
+    @property
+    def is_sorted(self):
+        return self.order is None
+
+    def positions(self, start=None, end=None):
+        """Positions of rows with start <= timestamp <= end (either bound optional)
+
+        A slice when the rows are time-sorted, else the matching positions
+        in their original row order.
+        """
+        lo = 0 if start is None else np.searchsorted(
+            self.sorted_values, pd.Timestamp(start).to_datetime64(), side='left')
+        hi = len(self.sorted_values) if end is None else np.searchsorted(
+            self.sorted_values, pd.Timestamp(end).to_datetime64(), side='right')
+        hi = max(lo, hi)
+
+        if self.order is None:
+            return slice(int(lo), int(hi))
+        return np.sort(self.order[lo:hi])
+
+    def select(self, df, start=None, end=None):
+        """Rows of df (the frame the index was built on) within the time range"""
+        return df.iloc[self.positions(start, end)]
+
+def sort_by_time(df, column='signal_lan'):
+    """Stable sort of a table by timestamp so date ranges become contiguous slices"""
+    if column not in df.columns or df[column].is_monotonic_increasing:
+        return df
+    return df.sort_values(column, kind='stable', na_position='last').reset_index(drop=True)
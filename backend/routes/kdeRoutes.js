@@ -0,0 +1,123 @@
+import express from 'express';
+import path from 'path';
+import fs from 'fs';
+import { fileURLToPath } from 'url';
+
+const router = express.Router();
+const __filename = fileURLToPath(import.meta.url);
+const __dirname = path.dirname(__filename);
+
+// Tile pyramid written by kde_analysis.py (see write_tile_pyramid)
+const tileDir = path.join(__dirname, '..', 'kde_tiles');
+const indexPath = path.join(tileDir, 'index.json');
+
+// Web Mercator ground resolution at zoom 0, in meters per pixel at the equator
+const METERS_PER_PIXEL_Z0 = 156543.03392;
+// Aim for density cells about this many pixels wide on screen
+const TARGET_CELL_PIXELS = 4;
+
+const readIndex = () => JSON.parse(fs.readFileSync(indexPath, 'utf8'));
+
+// Level whose cell size is closest (in log scale) to the requested one
+const pickLevel = (levels, cellSize) => levels.reduce((best, level) =>
+  Math.abs(Math.log(level.cell_size / cellSize)) < Math.abs(Math.log(best.cell_size / cellSize)) ? level : best
+);
+
+// GET endpoint to retrieve the KDE cells in a viewport at a zoom level
+// e.g. /api/kde/kde-tiles?bbox=76.85,8.45,77.05,8.60&zoom=13 (or &cellSize=100 in meters)
+router.get('/kde-tiles', (req, res) => {
+  try {
+    if (!fs.existsSync(indexPath)) {
+      return res.status(404).json({
+        success: false,
+        error: 'No KDE tiles found',
+        message: 'Please run KDE analysis with --tile-levels (e.g. 6) first'
+      });
+    }
+
+    const bbox = (req.query.bbox || '').split(',').map(Number);
+    if (bbox.length !== 4 || bbox.some(Number.isNaN)) {
+      return res.status(400).json({
+        success: false,
+        error: 'Invalid bbox',
+        message: 'Expected bbox=minLon,minLat,maxLon,maxLat'
+      });
+    }
+    const [minLon, minLat, maxLon, maxLat] = bbox;
+
+    let cellSize = Number(req.query.cellSize);
+    if (!cellSize) {
+      const zoom = Number(req.query.zoom);
+      if (Number.isNaN(zoom) || req.query.zoom === undefined) {
+        return res.status(400).json({
+          success: false,
+          error: 'Missing zoom',
+          message: 'Pass zoom or cellSize'
+        });
+      }
+      const latitude = ((minLat + maxLat) / 2) * Math.PI / 180;
+      cellSize = METERS_PER_PIXEL_Z0 * Math.cos(latitude) / Math.pow(2, zoom) * TARGET_CELL_PIXELS;
+    }
+
+    const index = readIndex();
+    if (index.levels.length === 0) {
+      return res.status(404).json({
+        success: false,
+        error: 'KDE tile index has no levels'
+      });
+    }
+    const level = pickLevel(index.levels, cellSize);
+
+    const tiles = level.tiles.filter(({ bbox: [west, south, east, north] }) =>
+      west <= maxLon && east >= minLon && south <= maxLat && north >= minLat
+    );
+
+    // Merge the tile CSVs under a single header
+    const rows = tiles.map(tile => {
+      const csvData = fs.readFileSync(path.join(tileDir, tile.file), 'utf8').trimEnd();
+      return csvData.slice(csvData.indexOf('\n') + 1);
+    }).filter(body => body !== '');
+
+    res.json({
+      success: true,
+      cellSize: level.cell_size,
+      tileCount: tiles.length,
+      cellCount: tiles.reduce((total, tile) => total + tile.cells, 0),
+      data: [index.columns.join(','), ...rows].join('\n') + '\n',
+      timestamp: fs.statSync(indexPath).mtime
+    });
+  } catch (error) {
+    res.status(500).json({
+      success: false,
+      error: 'Failed to retrieve KDE tiles',
+      details: error.message
+    });
+  }
+});
+
+// GET endpoint to list the available levels and tile bounds
+router.get('/kde-tiles/index', (req, res) => {
+  try {
+    if (!fs.existsSync(indexPath)) {
+      return res.status(404).json({
+        success: false,
+        error: 'No KDE tiles found',
+        message: 'Please run KDE analysis with --tile-levels (e.g. 6) first'
+      });
+    }
+
+    res.json({
+      success: true,
+      index: readIndex(),
+      timestamp: fs.statSync(indexPath).mtime
+    });
+  } catch (error) {
+    res.status(500).json({
+      success: false,
+      error: 'Failed to read KDE tile index',
+      details: error.message
+    });
+  }
+});
+
+export { router as kdeRoutes };
@@ -6,6 +6,7 @@ import { chartRoutes } from './routes/chartRoutes.js';
 import { config } from './config/config.js';
 import { hotspotRoutes } from './routes/hotspotRoutes.js';
 import { emergingHotspotsRoutes } from './routes/emergingHotspotRoutes.js';
+import { kdeRoutes } from './routes/kdeRoutes.js';
 
 const app = express();
 
@@ -20,6 +21,7 @@ app.use('/api', debugRoutes);
 app.use('/api/charts', chartRoutes);
 app.use('/api/hotspot', hotspotRoutes);
 app.use('/api/emerging-hotspots', emergingHotspotsRoutes);
+app.use('/api/kde', kdeRoutes);
 
 // Start server
 app.listen(config.PORT, () => {
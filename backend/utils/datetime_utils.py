@@ -1,4 +1,13 @@
 import pandas as pd
+import numpy as np
+
+DATETIME_FORMATS = [
+    '%Y-%m-%d %H:%M:%S',
+    '%Y-%m-%d %H:%M',
+    '%Y/%m/%d %H:%M:%S.%f',
+    '%Y/%m/%d %H:%M:%S',
+    '%Y-%m-%d'
+]
 
 def get_part_of_day(hour):
     """Categorize hour into part of day"""
@@ -13,15 +22,7 @@ def get_part_of_day(hour):
 
 def parse_datetime_string(datetime_str):
     """Parse datetime string with multiple format support"""
-    formats = [
-        '%Y-%m-%d %H:%M:%S',
-        '%Y-%m-%d %H:%M',
-        '%Y/%m/%d %H:%M:%S.%f',
-        '%Y/%m/%d %H:%M:%S',
-        '%Y-%m-%d'
-    ]
-    
-    for fmt in formats:
+    for fmt in DATETIME_FORMATS:
         try:
             return pd.to_datetime(datetime_str, format=fmt)
         except:
@@ -30,4 +31,60 @@ def parse_datetime_string(datetime_str):
     try:
         return pd.to_datetime(datetime_str)
     except:
-        return None
\ No newline at end of file
+        return None
+
+def parse_datetime_column(values, sample_size=1000):
+    """Parse a whole column of datetime strings with one vectorized pass per format
+
+    Gives the same result as applying parse_datetime_string to every value.
+    The formats match mutually exclusive layouts, so they can be tried in
+    order of how common they are in a sample; only rows no format accepts
+    go through the per-value fallback. Returns the parsed series (always
+    datetime64[ns], NaT where nothing parsed) and the number of rows each
+    format handled.
+    """
+    values = pd.Series(values)
+    raw = values.to_numpy()
+    parsed = np.full(len(values), np.datetime64('NaT'), dtype='datetime64[ns]')
+    pending = values.notna().to_numpy()
+    format_counts = {}
+    
+    for fmt in _formats_by_frequency(values[pending], sample_size):
+        if not pending.any():
+            break
+        pending_idx = np.flatnonzero(pending)
+        attempt = pd.to_datetime(pd.Series(raw[pending_idx]), format=fmt, errors='coerce')
+        matched = attempt.notna().to_numpy()
+        parsed[pending_idx[matched]] = attempt.to_numpy()[matched]
+        pending[pending_idx[matched]] = False
+        format_counts[fmt] = int(matched.sum())
+    
+    result = pd.Series(parsed, index=values.index, name=values.name)
+    
+    # Anything left over is parsed value by value, exactly as before
+    if pending.any():
+        # Coerced, as an all-None fallback would otherwise turn the column into objects
+        fallback = pd.to_datetime(values[pending].apply(_parse_inferred), errors='coerce')
+        format_counts['inferred'] = int(fallback.notna().sum())
+        result[fallback.index] = fallback
+    
+    return result, format_counts
+
+def _formats_by_frequency(values, sample_size):
+    """Order the known formats by how many sampled values each one parses"""
+    sample = values.head(sample_size)
+    if sample.empty:
+        return list(DATETIME_FORMATS)
+    
+    hits = {
+        fmt: pd.to_datetime(sample, format=fmt, errors='coerce').notna().sum()
+        for fmt in DATETIME_FORMATS
+    }
+    return sorted(DATETIME_FORMATS, key=lambda fmt: -hits[fmt])
+
+def _parse_inferred(datetime_str):
+    """Parse a value no known format accepts, letting pandas infer the layout"""
+    try:
+        return pd.to_datetime(datetime_str)
+    except:
+        return None
@@ -0,0 +1,33 @@
+import numpy as np
+import shapely
+
+def cell_edges(origin, cell_size, n):
+    """The n + 1 cell edges origin + k * cell_size along one axis"""
+    return origin + np.arange(n + 1) * cell_size
+
+def interior_cells(values, edges):
+    """Cell of each value along one axis, -1 where it is outside or on a cell edge
+
+    The cell comes from floor division, corrected by one where rounding put
+    a value next to its edge in the wrong cell. Values exactly on an edge
+    belong to no cell, like a shapely 'contains'/'within' test against the
+    cell polygons.
+    """
+    values = np.asarray(values, dtype=float)
+    n = len(edges) - 1
+    if n < 1:
+        return np.full(len(values), -1, dtype=np.int64)
+    cells = np.nan_to_num(np.floor((values - edges[0]) / (edges[1] - edges[0])), nan=-1.0)
+    cells = np.clip(cells, 0, n - 1).astype(np.int64)
+    # Rounding can put a value just across an edge into the neighbouring cell
+    cells -= (values < edges[cells]) & (cells > 0)
+    cells += (values >= edges[cells + 1]) & (cells < n - 1)
+    inside = (values > edges[cells]) & (values < edges[cells + 1])
+    return np.where(inside, cells, -1)
+
+def cell_polygons(x_edges, y_edges, cell_i, cell_j):
+    """Square polygons for cells (i, j), with corners (x0, y0), (x1, y0), (x1, y1), (x0, y1)"""
+    x0, x1 = x_edges[cell_i], x_edges[cell_i + 1]
+    y0, y1 = y_edges[cell_j], y_edges[cell_j + 1]
+    rings = np.stack([np.column_stack(corner) for corner in ((x0, y0), (x1, y0), (x1, y1), (x0, y1))], axis=1)
+    return shapely.polygons(rings)
@@ -0,0 +1,21 @@
+import numpy as np
+from functools import lru_cache
+from pyproj import Transformer
+
+WGS84 = "EPSG:4326"
+UTM_43N = "EPSG:32643"  # UTM Zone 43N, the projected CRS used for distances in meters
+
+@lru_cache(maxsize=None)
+def get_transformer(from_crs, to_crs):
+    """Cached transformer between two CRS, with x/y (lon/lat) axis order like GeoDataFrame.to_crs"""
+    return Transformer.from_crs(from_crs, to_crs, always_xy=True)
+
+def to_projected(longitude, latitude):
+    """Project WGS84 lon/lat arrays to UTM 43N meters"""
+    x, y = get_transformer(WGS84, UTM_43N).transform(np.asarray(longitude, dtype=float), np.asarray(latitude, dtype=float))
+    return np.asarray(x), np.asarray(y)
+
+def to_wgs84(x, y):
+    """Convert UTM 43N coordinate arrays back to WGS84 lon/lat"""
+    longitude, latitude = get_transformer(UTM_43N, WGS84).transform(np.asarray(x, dtype=float), np.asarray(y, dtype=float))
+    return np.asarray(longitude), np.asarray(latitude)